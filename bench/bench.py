@@ -0,0 +1,199 @@
+"""
+This is the benchmark of a dashboard refresh. It starts the local stand-ins from fakes.py, points the real modules at
+them and times every stage of an update, so runs with different data sizes, latencies or code versions can be
+compared without touching any of the real services.
+
+    python -m bench.bench --calendars 50 --events 5000 --todos 2000 --latency 0.02 --runs 5 --json before.json
+    python -m bench.bench --calendars 50 --events 5000 --todos 2000 --latency 0.02 --runs 5 --compare before.json
+
+Stages: weather, retrieve_events, get_events (bucketing into days), tasks, memo, todo and process_inputs. The render
+stages process_inputs runs (render_native or render_html and screenshot, eink, publish) are listed below it, taken from
+the metrics of the render, and are not counted again in the total.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import os.path
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime as dt
+from pytz import timezone
+from google.oauth2.credentials import Credentials
+from bench.fakes import FakeData, FakeServices
+from dumbdo.dumbdo import Dumbdo
+from gcal.gcal import GcalModule
+from gcal.gclient import GoogleClient
+from httpcache.httpcache import HttpCache
+from memos.memos import Memos
+from metrics.metrics import Metrics
+from owm.owm import OWMModule
+from render.assets import AssetBuilder
+from render.render import RenderHelper
+
+
+class Benchmark:
+
+    def __init__(self, args):
+        self.args = args
+        self.tz = timezone(args.tz)
+        self.workDir = tempfile.mkdtemp(prefix='maginkdash-bench-')
+        self.timings = {}
+        self.items = {}
+        # The render stages inside process_inputs are read from the metrics, stats are never written to the file
+        self.metrics = Metrics(statsFile=os.path.join(self.workDir, 'stats.json'))
+        Metrics.set_instance(self.metrics)
+        # stage: stage it is part of
+        self.parents = {}
+
+        data = FakeData(self.tz, calendars=args.calendars, events=args.events, tasklists=args.tasklists,
+                        tasks=args.tasks, todos=args.todos)
+        self.calendars = list(data.events)
+        self.tasklists = list(data.tasks)
+        self.services = FakeServices(data, latency=args.latency).start()
+
+        # Every response is revalidated, the stand-ins don't send validators so that means a full download each run
+        self.http = HttpCache(cacheFile=os.path.join(self.workDir, 'httpcache.json'),
+                              ttls={'owm': 0, 'memos': 0, 'dumbdo': 0})
+        client = GoogleClient(creds=Credentials(token='bench'), rootUrl=self.services.url + '/')
+        self.calModule = GcalModule(eventSync=args.sync, taskSync=args.sync, batch=args.batch, client=client)
+        self.calModule.calHelper.syncDir = os.path.join(self.workDir, 'sync')
+
+        nginxDir = os.path.join(self.workDir, 'nginx') + '/'
+        os.makedirs(nginxDir)
+        self.renderService = RenderHelper(args.width, args.height, nginx_server_dir=nginxDir,
+                                          nginx_serving_path='http://127.0.0.1/', browserless_url=self.services.url,
+                                          browserless_token='bench', renderer=args.renderer)
+        if args.renderer != 'native':
+            AssetBuilder(self.renderService.currPath, nginxDir).build(
+                [self.renderService.template.load().source], [(args.width, args.height)])
+        self.imagePath = os.path.join(self.workDir, 'dashboard.png')
+
+    def time(self, stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.timings.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    def run_once(self):
+        currDate = dt.now(self.tz).date()
+        numDays = self.args.days
+        calStartDatetime = self.tz.localize(dt.combine(currDate, dt.min.time()))
+        calEndDatetime = self.tz.localize(dt.combine(currDate + datetime.timedelta(days=numDays - 1), dt.max.time()))
+
+        owmModule = OWMModule(http=self.http, url=self.services.url + '/data/3.0/onecall')
+        current_weather, hourly_forecast, daily_forecast = self.time('weather', owmModule.get_weather, 0, 0, 'bench')
+
+        calHelper = self.calModule.calHelper
+        events = self.time('retrieve_events', calHelper.retrieve_events, self.calendars, calStartDatetime,
+                           calEndDatetime, self.tz)
+        self.items['retrieve_events'] = len(events)
+        eventList = self.time('get_events', self.calModule.bucket_events, currDate, events, numDays)
+        self.items['get_events'] = len(events)
+        taskList = self.time('tasks', self.calModule.get_tasks, currDate, self.tasklists, calStartDatetime,
+                             calEndDatetime, self.tz, numDays)
+        self.items['tasks'] = sum(len(day) for day in taskList)
+
+        memo = self.time('memo', Memos(http=self.http).get_memo, self.services.url, 'bench', 'dashboard')
+        todo = self.time('todo', Dumbdo(http=self.http).get_list, self.services.url, 'Home')
+        self.items['todo'] = len(self.services.data.todos['Home'])
+
+        # Without the digest of the previous run the whole render runs every time
+        digestFile = self.imagePath + '.digest'
+        if os.path.exists(digestFile):
+            os.remove(digestFile)
+        self.metrics.start_run()
+        self.time('process_inputs', self.renderService.process_inputs, currDate, current_weather, hourly_forecast,
+                  daily_forecast, eventList, taskList, numDays, memo or todo, self.imagePath)
+        for stage, seconds in self.metrics.currentRun.items():
+            self.timings.setdefault(stage, []).append(seconds)
+            self.parents[stage] = 'process_inputs'
+
+    def run(self):
+        for _ in range(self.args.warmup):
+            self.run_once()
+        self.timings = {}
+        try:
+            for _ in range(self.args.runs):
+                self.run_once()
+        finally:
+            self.services.stop()
+            shutil.rmtree(self.workDir, ignore_errors=True)
+        return self.get_report()
+
+    def get_report(self):
+        report = {'args': vars(self.args), 'requests': self.services.requests, 'stages': {}}
+        for stage, timings in self.timings.items():
+            timings = sorted(timings)
+            entry = {
+                'runs': len(timings),
+                'mean_ms': 1000 * statistics.mean(timings),
+                'p50_ms': 1000 * statistics.median(timings),
+                'p95_ms': 1000 * timings[min(len(timings) - 1, round(0.95 * (len(timings) - 1)))],
+                'max_ms': 1000 * timings[-1]
+            }
+            if stage in self.parents:
+                entry['part_of'] = self.parents[stage]
+            if stage in self.items and entry['mean_ms'] > 0:
+                entry['items'] = self.items[stage]
+                entry['items_per_s'] = self.items[stage] / (entry['mean_ms'] / 1000)
+            report['stages'][stage] = entry
+        return report
+
+
+def print_report(report, baseline=None):
+    print('{0:<16}{1:>6}{2:>11}{3:>11}{4:>11}{5:>11}{6:>14}{7:>10}'.format(
+        'stage', 'runs', 'mean ms', 'p50 ms', 'p95 ms', 'max ms', 'items/s', 'vs base'))
+    for stage, entry in report['stages'].items():
+        compare = ''
+        if baseline is not None and stage in baseline['stages'] and entry['mean_ms'] > 0:
+            compare = '{0:.2f}x'.format(baseline['stages'][stage]['mean_ms'] / entry['mean_ms'])
+        print('{0:<16}{1:>6}{2:>11.1f}{3:>11.1f}{4:>11.1f}{5:>11.1f}{6:>14}{7:>10}'.format(
+            ('  ' if 'part_of' in entry else '') + stage, entry['runs'], entry['mean_ms'], entry['p50_ms'], entry['p95_ms'], entry['max_ms'],
+            '{0:.0f}'.format(entry['items_per_s']) if 'items_per_s' in entry else '', compare))
+    total = sum(entry['mean_ms'] for entry in report['stages'].values() if 'part_of' not in entry)
+    print('{0:<16}{1:>6}{2:>11.1f}'.format('total', '', total))
+    print('requests: ' + ', '.join('{0} {1}'.format(name, count) for name, count in sorted(report['requests'].items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark a dashboard refresh against local stand-in services')
+    parser.add_argument('--calendars', type=int, default=5)
+    parser.add_argument('--events', type=int, default=500, help='events over all calendars, spread over 30 days')
+    parser.add_argument('--tasklists', type=int, default=2)
+    parser.add_argument('--tasks', type=int, default=100)
+    parser.add_argument('--todos', type=int, default=50)
+    parser.add_argument('--days', type=int, default=3, help='days shown on the dashboard')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds every request to a stand-in takes')
+    parser.add_argument('--sync', choices=['full', 'incremental'], default='full')
+    parser.add_argument('--batch', action='store_true', help='batch the Google API calls')
+    parser.add_argument('--renderer', choices=['native', 'browserless'], default='native')
+    parser.add_argument('--width', type=int, default=1200)
+    parser.add_argument('--height', type=int, default=825)
+    parser.add_argument('--tz', default='Europe/Warsaw')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--compare', help='report from an earlier run to compare with')
+    args = parser.parse_args()
+
+    logging.getLogger('maginkdash').setLevel(logging.WARNING)
+    report = Benchmark(args).run()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
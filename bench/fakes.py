@@ -0,0 +1,230 @@
+"""
+These are local stand-ins for every service the dashboard talks to, served from one threaded HTTP server:
+    /data/3.0/onecall                           OpenWeatherMap One Call
+    /calendar/v3/calendars/<id>/events          Google Calendar v3 event lists, paged, with sync tokens
+    /tasks/v1/lists/<id>/tasks                  Google Tasks v1 task lists, paged
+    /batch/calendar/v3 and /batch               Google batch endpoints for the two APIs above
+    /api/v1/memos                               Memos
+    /api/todos                                  DumbDo
+    /screenshot                                 browserless
+The data is generated once from a seed, so every run of the benchmark sees the same payloads, and every request waits
+for a configurable latency before it is answered.
+"""
+
+import datetime
+import email.parser
+import io
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+
+WORDS = ['Standup', 'Review', 'Lunch', 'Dentist', 'Gym', 'Planning', 'Call', 'Dinner', 'Workshop', 'Retro', 'Demo',
+         'Pick up kids', 'Groceries', 'Flight', 'Birthday', 'Interview', 'Sync', 'Coffee', 'Doctor', 'Football']
+
+
+class FakeData:
+
+    def __init__(self, tz, calendars=5, events=500, tasklists=2, tasks=100, todos=50, days=30, seed=1):
+        rng = random.Random(seed)
+        self.tz = tz
+        today = datetime.date.today()
+        start = tz.localize(datetime.datetime.combine(today - datetime.timedelta(days=1), datetime.time.min))
+        updated = datetime.datetime.now(datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+
+        self.events = {'cal{0}@group.calendar.google.com'.format(i): [] for i in range(calendars)}
+        calendarIds = list(self.events)
+        for i in range(events):
+            cal = calendarIds[i % calendars]
+            eventStart = start + datetime.timedelta(minutes=15 * rng.randrange(days * 96))
+            event = {'kind': 'calendar#event', 'id': 'evt{0}'.format(i), 'status': 'confirmed', 'updated': updated,
+                     'summary': '{0} {1}'.format(rng.choice(WORDS), i)}
+            kind = rng.random()
+            if kind < 0.1:
+                # All day, sometimes over several days
+                length = 1 if kind < 0.07 else rng.randrange(2, 5)
+                event['start'] = {'date': eventStart.date().isoformat()}
+                event['end'] = {'date': (eventStart.date() + datetime.timedelta(days=length)).isoformat()}
+            else:
+                eventEnd = eventStart + datetime.timedelta(minutes=15 * rng.randrange(1, 9))
+                event['start'] = {'dateTime': eventStart.isoformat()}
+                event['end'] = {'dateTime': eventEnd.isoformat()}
+            self.events[cal].append(event)
+
+        self.tasks = {'list{0}'.format(i): [] for i in range(tasklists)}
+        tasklistIds = list(self.tasks)
+        for i in range(tasks):
+            due = today + datetime.timedelta(days=rng.randrange(days))
+            self.tasks[tasklistIds[i % tasklists]].append({
+                'kind': 'tasks#task', 'id': 'task{0}'.format(i), 'title': '{0} task {1}'.format(rng.choice(WORDS), i),
+                'updated': updated, 'status': 'needsAction', 'due': due.isoformat() + 'T00:00:00.000Z'})
+
+        self.todos = {'Home': [{'id': i, 'text': '{0} {1}'.format(rng.choice(WORDS), i), 'completed': rng.random() < 0.5}
+                               for i in range(todos)]}
+
+        now = int(time.time())
+        condition = {'id': 500, 'main': 'Rain', 'description': 'light rain', 'icon': '10d'}
+        self.weather = {
+            'lat': 0, 'lon': 0, 'timezone': str(tz), 'timezone_offset': 0,
+            'current': {'dt': now, 'temp': 12.3, 'weather': [condition]},
+            'hourly': [{'dt': now + 3600 * h, 'temp': 10 + h % 7, 'pop': 0.2, 'weather': [condition]} for h in range(48)],
+            'daily': [{'dt': now + 86400 * d, 'temp': {'min': 5 + d, 'max': 15 + d}, 'pop': 0.1 * d,
+                       'weather': [condition]} for d in range(8)]
+        }
+        self.memo = {'memos': [{'name': 'memos/1', 'content': '#dashboard Water the plants\nCall the plumber'}]}
+
+
+class FakeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.handle_request('GET', b'')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.handle_request('POST', body)
+
+    def handle_request(self, method, body):
+        services = self.server.services
+        time.sleep(services.latency)
+        services.count(self.path)
+        if self.path.startswith('/batch'):
+            status, contentType, payload = services.handle_batch(self.headers['Content-Type'], body)
+        else:
+            status, contentType, payload = services.route(method, self.path, body)
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        try:
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # Clients that parse the response as it streams in hang up once they have what they need
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeServices:
+
+    def __init__(self, data, latency=0.0, host='127.0.0.1', port=0):
+        self.data = data
+        # Seconds every request waits before it is answered, a batch counts as one request
+        self.latency = latency
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.screenshots = {}
+        self.httpd = ThreadingHTTPServer((host, port), FakeRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.services = self
+        self.url = 'http://{0}:{1}'.format(*self.httpd.server_address)
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name='fakes', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, path):
+        name = path.split('?', 1)[0].strip('/').split('/')[0]
+        with self.lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+
+    def json(self, payload, status=200):
+        return status, 'application/json', json.dumps(payload).encode('utf-8')
+
+    def page(self, items, query, defaultSize, extra):
+        # Paging through a list the same way the Google APIs do, with the page offset as the token
+        offset = int(query.get('pageToken', '0'))
+        size = int(query.get('maxResults', defaultSize))
+        result = dict(extra, items=items[offset:offset + size])
+        if offset + size < len(items):
+            result['nextPageToken'] = str(offset + size)
+        return result
+
+    def route(self, method, path, body):
+        parsed = urllib.parse.urlsplit(path)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        parts = [urllib.parse.unquote(part) for part in parsed.path.strip('/').split('/')]
+
+        if parsed.path == '/data/3.0/onecall':
+            return self.json(self.data.weather)
+        if parsed.path == '/api/v1/memos':
+            return self.json(self.data.memo)
+        if parsed.path == '/api/todos':
+            return self.json(self.data.todos)
+        if parsed.path == '/screenshot' and method == 'POST':
+            return self.screenshot(json.loads(body))
+        if parts[:3] == ['calendar', 'v3', 'calendars'] and len(parts) == 5 and parts[4] == 'events':
+            return self.list_events(parts[3], query)
+        if parts[:3] == ['tasks', 'v1', 'lists'] and len(parts) == 5 and parts[4] == 'tasks':
+            return self.list_tasks(parts[3], query)
+        return self.json({'error': {'code': 404, 'message': 'Not found'}}, 404)
+
+    def list_events(self, calendarId, query):
+        if calendarId not in self.data.events:
+            return self.json({'error': {'code': 404, 'message': 'Not found'}}, 404)
+        if 'syncToken' in query:
+            # Nothing changes between runs, an incremental sync comes back empty
+            return self.json(self.page([], query, 250, {'nextSyncToken': 'sync'}))
+        timeMin, timeMax = query.get('timeMin'), query.get('timeMax')
+        items = []
+        for event in self.data.events[calendarId]:
+            start = event['start'].get('dateTime') or event['start']['date'] + 'T00:00:00+00:00'
+            end = event['end'].get('dateTime') or event['end']['date'] + 'T00:00:00+00:00'
+            if timeMin is not None and datetime.datetime.fromisoformat(end.replace('Z', '+00:00')) <= \
+                    datetime.datetime.fromisoformat(timeMin.replace('Z', '+00:00')):
+                continue
+            if timeMax is not None and datetime.datetime.fromisoformat(start.replace('Z', '+00:00')) >= \
+                    datetime.datetime.fromisoformat(timeMax.replace('Z', '+00:00')):
+                continue
+            items.append(event)
+        if query.get('orderBy') == 'startTime':
+            items.sort(key=lambda event: event['start'].get('dateTime') or event['start']['date'])
+        return self.json(self.page(items, query, 250, {'kind': 'calendar#events', 'nextSyncToken': 'sync'}))
+
+    def list_tasks(self, tasklistId, query):
+        if tasklistId not in self.data.tasks:
+            return self.json({'error': {'code': 404, 'message': 'Not found'}}, 404)
+        items = self.data.tasks[tasklistId]
+        if 'dueMin' in query:
+            items = [task for task in items if task['due'][:10] >= query['dueMin'][:10]]
+        if 'dueMax' in query:
+            items = [task for task in items if task['due'][:10] <= query['dueMax'][:10]]
+        if 'updatedMin' in query:
+            items = []
+        return self.json(self.page(items, query, 20, {'kind': 'tasks#tasks'}))
+
+    def handle_batch(self, contentType, body):
+        # Every part holds one HTTP request, answered in a part of the multipart response with the same Content-ID
+        message = email.parser.BytesParser().parsebytes(b'Content-Type: ' + contentType.encode('ascii') + b'\r\n\r\n' + body)
+        boundary = 'batch_fake'
+        out = io.BytesIO()
+        for part in message.get_payload():
+            request = part.get_payload()
+            if isinstance(request, list):
+                request = request[0].as_string()
+            requestLine = request.lstrip().split('\r\n' if '\r\n' in request else '\n', 1)[0]
+            method, path = requestLine.split(' ')[:2]
+            status, partType, payload = self.route(method, path, b'')
+            out.write('--{0}\r\nContent-Type: application/http\r\nContent-ID: <response-{1}>\r\n\r\n'.format(
+                boundary, part['Content-ID'].strip('<>')).encode('utf-8'))
+            out.write('HTTP/1.1 {0} {1}\r\nContent-Type: {2}\r\nContent-Length: {3}\r\n\r\n'.format(
+                status, 'OK' if status == 200 else 'Error', partType, len(payload)).encode('utf-8'))
+            out.write(payload + b'\r\n')
+        out.write('--{0}--\r\n'.format(boundary).encode('utf-8'))
+        return 200, 'multipart/mixed; boundary=' + boundary, out.getvalue()
+
+    def screenshot(self, request):
+        size = (request['viewport']['width'], request['viewport']['height'])
+        if size not in self.screenshots:
+            out = io.BytesIO()
+            Image.new('RGB', size, (255, 255, 255)).save(out, 'PNG')
+            self.screenshots[size] = out.getvalue()
+        return 200, 'image/png', self.screenshots[size]
@@ -4,42 +4,44 @@
 
 import logging
 import requests
+from httpcache.httpcache import HttpCache
+from httpcache.jsonstream import find_member
 
 class Dumbdo:
-    def __init__(self):
+    def __init__(self, http=None):
         self.logger = logging.getLogger('maginkdash')
+        self.http = http if http is not None else HttpCache.get_instance()
 
     def get_list(self, domain, listName):
         self.logger.info('Retrieving ToDo list from the domain {0} and list {1}'.format(domain, listName))
         
         try:
-            r = requests.get(domain + '/api/todos',
-                             headers={'Accept': 'application/json'},
-                             timeout=10)
-            r.raise_for_status()
+            # DumbDo only serves all lists at once, the response is read until the list is complete and the rest of
+            # it is never downloaded
+            entries = self.http.get_json('dumbdo', domain + '/api/todos',
+                                         headers={'Accept': 'application/json'},
+                                         timeout=10,
+                                         parse=lambda r: find_member(r.iter_content(chunk_size=65536), listName),
+                                         variant='list:' + listName)
         except requests.exceptions.HTTPError as errh:
-            self.logger.info("Http Error:",errh)
+            self.logger.info("Http Error: {0}".format(errh))
             return None
         except requests.exceptions.ConnectionError as errc:
-            self.logger.info("Error Connecting:",errc)
+            self.logger.info("Error Connecting: {0}".format(errc))
             return None
         except requests.exceptions.Timeout as errt:
-            self.logger.info("Timeout Error:",errt)
+            self.logger.info("Timeout Error: {0}".format(errt))
             return None
         except requests.exceptions.RequestException as err:
-            self.logger.info("OOps: Something Else",err)
+            self.logger.info("OOps: Something Else {0}".format(err))
             return None
             
-        json_response = r.json()
-        data = json_response
+        # None means the list couldn't be retrieved, an empty string that there is nothing to show
+        if entries is None:
+            self.logger.info('List {0} not found'.format(listName))
+            return ''
 
-        if len(data) == 0:
-            return None
-
-        text = ''
-        for entry in data[listName]:
-            if entry['completed'] == False:
-                text = text + '\n• ' + entry['text']
+        text = '\n'.join('• ' + entry['text'] for entry in entries if not entry['completed'])
         text = text.strip()
         
         return text
\ No newline at end of file
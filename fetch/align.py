@@ -0,0 +1,29 @@
+"""
+The calendar, tasks and weather results are tied to the day they were fetched on: the events and tasks are split into
+days starting with that day, and the daily forecast starts with it as well. When one of them is shown from an older
+result after the date changed (e.g. because its fetch failed at midnight), its days are moved to start at the current
+date, the days that were never fetched are left empty, and the forecast hours and days that are over are dropped.
+"""
+
+from datetime import datetime as dt
+
+
+def align_days(days, fetchedDate, currDate, numDays):
+    # days[0] is fetchedDate, returns numDays days starting with currDate
+    shift = (currDate - fetchedDate).days
+    if shift <= 0:
+        return days
+    days = list(days[shift:])
+    return days + [[] for _ in range(numDays - len(days))]
+
+
+def align_weather(weather, now):
+    # Returns the forecast as of now, None once too little of it is left to fill the dashboard
+    current_weather, hourly_forecast, daily_forecast = weather
+    timestamp = now.timestamp()
+    # Starting with the hour now falls in, so the second entry is still the next hour
+    hourly_forecast = [hour for hour in hourly_forecast if hour['dt'] + 3600 > timestamp]
+    daily_forecast = [day for day in daily_forecast if dt.fromtimestamp(day['dt'], now.tzinfo).date() >= now.date()]
+    if len(hourly_forecast) < 2 or not daily_forecast:
+        return None
+    return current_weather, hourly_forecast, daily_forecast
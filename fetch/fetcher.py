@@ -0,0 +1,102 @@
+"""
+This is where the data sources of the dashboard are retrieved. Every source is registered with its own deadline and
+all of them are fetched in parallel on a shared thread pool, so an update only takes as long as the slowest source
+and a hung request can't hold back the rest of the refresh.
+"""
+
+import concurrent.futures
+import functools
+import logging
+import threading
+import time
+from metrics.metrics import Metrics
+
+
+class Fetcher:
+    def __init__(self, max_workers=8):
+        self.logger = logging.getLogger('maginkdash')
+        self.sources = {}
+        self.metrics = Metrics.get_instance()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch')
+        # A source that misses its deadline keeps running in the background, its result is handed out by the next
+        # fetch and onLate (if set) is called without arguments as soon as it arrives
+        self.lock = threading.Lock()
+        self.running = {}
+        self.late = {}
+        self.lateResults = {}
+        self.onLate = None
+
+    def add_source(self, name, func, deadline):
+        # func is called without arguments on a worker thread, deadline is in seconds from the start of the fetch
+        self.sources[name] = (func, deadline)
+
+    def run_source(self, name, func):
+        with self.metrics.timer('fetch_' + name):
+            return func()
+
+    def collect_late(self, name, future):
+        # Done callbacks run only after waiters are woken up, so both the callback and wait_running may get here first
+        with self.lock:
+            if self.late.pop(name, None) is None:
+                return False
+        if future.cancelled() or future.exception() is not None:
+            self.logger.error('Source {0} failed after missing its deadline: {1}'.format(name, future.exception()))
+            return False
+        self.logger.info('Source {0} finished after its deadline'.format(name))
+        with self.lock:
+            self.lateResults[name] = future.result()
+        return True
+
+    def on_late_result(self, name, future):
+        if self.collect_late(name, future) and self.onLate is not None:
+            self.onLate()
+
+    def wait_running(self, timeout=None):
+        # Waits for the sources still running after their deadline, returns True if any of their results came in
+        with self.lock:
+            late = dict(self.late)
+        concurrent.futures.wait(list(late.values()), timeout=timeout)
+        for name, future in late.items():
+            if future.done():
+                self.collect_late(name, future)
+        with self.lock:
+            return len(self.lateResults) > 0
+
+    def fetch(self, names=None):
+        # Start every requested source at once and collect whatever finished before its deadline, together with the
+        # results of earlier fetches that only came in after their deadline
+        if names is None:
+            names = list(self.sources)
+
+        start = time.monotonic()
+        futures = {}
+        for name in names:
+            running = self.running.get(name)
+            if running is not None and not running.done():
+                # Still busy from an earlier fetch, starting it again would only pile up threads
+                self.logger.info('Source {0} is still running from an earlier fetch'.format(name))
+                continue
+            func, deadline = self.sources[name]
+            futures[name] = (self.executor.submit(self.run_source, name, func), deadline)
+            self.running[name] = futures[name][0]
+
+        with self.lock:
+            results = self.lateResults
+            self.lateResults = {}
+        for name, (future, deadline) in futures.items():
+            remaining = deadline - (time.monotonic() - start)
+            try:
+                results[name] = future.result(timeout=max(remaining, 0))
+            except concurrent.futures.TimeoutError:
+                self.logger.error('Source {0} missed its deadline of {1}s'.format(name, deadline))
+                self.metrics.inc('errors', source=name)
+                with self.lock:
+                    self.late[name] = future
+                future.add_done_callback(functools.partial(self.on_late_result, name))
+            except Exception:
+                self.logger.exception('Source {0} failed'.format(name))
+                self.metrics.inc('errors', source=name)
+
+        self.logger.info('Fetched {0}/{1} sources in {2:.2f}s'.format(len(results), len(futures),
+                                                                       time.monotonic() - start))
+        return results
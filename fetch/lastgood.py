@@ -0,0 +1,68 @@
+"""
+This keeps the last good result of every data source on disk. When a source fails or misses its deadline, the
+dashboard is rendered from what it returned last time instead of being skipped, and since the store survives a
+restart even the first update after a start can go ahead without every source answering.
+"""
+
+import logging
+import os
+import os.path
+import pathlib
+import pickle
+import threading
+import time
+
+# Raised when the results kept change shape, entries of an older version are dropped instead of rendered
+VERSION = 2
+
+
+class LastGoodStore:
+
+    def __init__(self, storeFile=None):
+        self.logger = logging.getLogger('maginkdash')
+        self.currPath = str(pathlib.Path(__file__).parent.absolute())
+        # Pickled, the calendar and task results hold timezone aware datetimes
+        self.storeFile = storeFile if storeFile is not None else self.currPath + '/cache/lastgood.pickle'
+        self.lock = threading.Lock()
+        # name: (time fetched, result)
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.storeFile):
+            return
+        try:
+            with open(self.storeFile, 'rb') as file:
+                stored = pickle.load(file)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            self.logger.info('Last good store is corrupt, starting with an empty one')
+            return
+        if not isinstance(stored, dict) or stored.get('version') != VERSION:
+            self.logger.info('Last good store is from an older version, starting with an empty one')
+            return
+        self.entries = stored['entries']
+
+    def save(self):
+        # Called with the lock held
+        os.makedirs(os.path.dirname(self.storeFile), exist_ok=True)
+        tmpFile = self.storeFile + '.tmp'
+        with open(tmpFile, 'wb') as file:
+            pickle.dump({'version': VERSION, 'entries': self.entries}, file)
+        os.replace(tmpFile, self.storeFile)
+
+    def put(self, name, result):
+        with self.lock:
+            self.entries[name] = (time.time(), result)
+            self.save()
+
+    def get(self, name):
+        entry = self.entries.get(name)
+        return None if entry is None else entry[1]
+
+    def get_time(self, name):
+        # Seconds since the epoch when the result was fetched
+        entry = self.entries.get(name)
+        return None if entry is None else entry[0]
+
+    def __contains__(self, name):
+        return name in self.entries
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This is where the events of the displayed window are split into days. The events are sorted by start once, so the
+events starting on a day are always one contiguous run of that list, found with a binary search. Events spanning
+several days are carried from one day to the next in a single sweep over the days, clipped at the window edges.
+A day is a read-only view over the shared sorted list and the carried events, and days with the same carried events
+share one tuple, so nothing is copied per day and week or month windows with thousands of events stay linear.
+"""
+
+import bisect
+import collections.abc
+import datetime
+import operator
+
+
+class DaySlice(collections.abc.Sequence):
+    # The events of one day in start order: the carried multi-day events (which all started on an earlier day) followed
+    # by events[lo:hi], the events starting on this day
+    __slots__ = ('carried', 'events', 'lo', 'hi')
+
+    def __init__(self, carried, events, lo, hi):
+        self.carried = carried
+        self.events = events
+        self.lo = lo
+        self.hi = hi
+
+    def __len__(self):
+        return len(self.carried) + self.hi - self.lo
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('day index out of range')
+        if index < len(self.carried):
+            return self.carried[index]
+        return self.events[self.lo + index - len(self.carried)]
+
+    def __iter__(self):
+        yield from self.carried
+        for i in range(self.lo, self.hi):
+            yield self.events[i]
+
+    def __eq__(self, other):
+        if isinstance(other, collections.abc.Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        # Same as the list it stands for, the scheduler compares results by their repr
+        return repr(list(self))
+
+    def __getstate__(self):
+        return self.carried, self.events, self.lo, self.hi
+
+    def __setstate__(self, state):
+        self.carried, self.events, self.lo, self.hi = state
+
+
+def bucket_events(currDate, eventList, numDays):
+    # Returns a list of numDays DaySlices, day 0 being currDate
+    # Already sorted by retrieve_events, in which case this is a single linear pass
+    events = sorted(eventList, key=operator.attrgetter('startDatetime'))
+    startDates = [event.startDatetime.date() for event in events]
+
+    # Multi-day events that started before the window and are still going on its first day
+    first = bisect.bisect_left(startDates, currDate)
+    active = [event for event in events[:first] if event.isMultiday and event.endDatetime.date() >= currDate]
+
+    days = []
+    carried = tuple(active)
+    lo = first
+    for i in range(numDays):
+        day = currDate + datetime.timedelta(days=i)
+        hi = bisect.bisect_left(startDates, day + datetime.timedelta(days=1), lo)
+        if i > 0:
+            # Drop what ended the day before and add what started then and goes on, the tuple is only rebuilt if the
+            # carried events actually change
+            ended = any(event.endDatetime.date() < day for event in carried)
+            started = [event for event in events[days[-1].lo:days[-1].hi]
+                       if event.isMultiday and event.endDatetime.date() >= day]
+            if ended or started:
+                carried = tuple([event for event in carried if event.endDatetime.date() >= day] + started)
+        days.append(DaySlice(carried, events, lo, hi))
+        lo = hi
+    return days
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This is where the events of a calendar are kept between runs when incremental sync is enabled. Each calendar has its
+own JSON file with the raw event items, the sync token returned by the Calendar API and the time range the token was
+created for, so a refresh only has to apply the events that changed since the previous one.
+"""
+
+import datetime as dt
+import hashlib
+import json
+import os
+import os.path
+
+# Only the fields needed to build the dashboard events are kept on disk
+EVENT_FIELDS = ('id', 'status', 'summary', 'start', 'end', 'updated')
+
+
+class EventStore:
+
+    def __init__(self, storeDir, calendarId):
+        self.calendarId = calendarId
+        self.file = '{0}/{1}.json'.format(storeDir, hashlib.sha1(calendarId.encode('utf-8')).hexdigest())
+        self.syncToken = None
+        self.timeMin = None
+        self.timeMax = None
+        self.items = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.file):
+            return
+        with open(self.file, 'r') as file:
+            data = json.load(file)
+        self.syncToken = data.get('syncToken')
+        self.timeMin = data.get('timeMin')
+        self.timeMax = data.get('timeMax')
+        self.items = data.get('items', {})
+
+    def save(self):
+        # Write to a temporary file first so a crash mid-write can't leave a corrupt store behind
+        os.makedirs(os.path.dirname(self.file), exist_ok=True)
+        tmpFile = self.file + '.tmp'
+        with open(tmpFile, 'w') as file:
+            json.dump({'calendarId': self.calendarId, 'syncToken': self.syncToken, 'timeMin': self.timeMin,
+                       'timeMax': self.timeMax, 'items': self.items}, file)
+        os.replace(tmpFile, self.file)
+
+    def reset(self, timeMin, timeMax):
+        # Drop everything, the next sync has to be a full one over the given range
+        self.syncToken = None
+        self.timeMin = timeMin
+        self.timeMax = timeMax
+        self.items = {}
+
+    @staticmethod
+    def to_utc_str(datetimeObj):
+        # Range bounds are stored in UTC so they compare correctly as strings across DST changes
+        return datetimeObj.astimezone(dt.timezone.utc).isoformat()
+
+    def covers(self, startDatetime, endDatetime):
+        # Whether the synced range still contains the window to be displayed
+        if self.syncToken is None or self.timeMin is None or self.timeMax is None:
+            return False
+        return self.timeMin <= self.to_utc_str(startDatetime) and self.to_utc_str(endDatetime) <= self.timeMax
+
+    def apply(self, events):
+        # Cancelled events are deletions, everything else replaces the stored copy
+        changed = 0
+        for event in events:
+            if event.get('status') == 'cancelled':
+                if self.items.pop(event['id'], None) is not None:
+                    changed += 1
+            else:
+                self.items[event['id']] = {key: event[key] for key in EVENT_FIELDS if key in event}
+                changed += 1
+        return changed
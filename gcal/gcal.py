@@ -4,13 +4,18 @@ credentials.json and token.pickle in the same folder as this file. If not, run q
 """
 
 from gcal.gcalhelper import GcalHelper
+from gcal import daybuckets
+from gcal.records import TaskRecord
+from metrics.metrics import Metrics
+import datetime
 import logging
 
 
 class GcalModule:
-    def __init__(self):
+    def __init__(self, eventSync='full', taskSync='full', batch=False, client=None):
         self.logger = logging.getLogger('maginkdash')
-        self.calHelper = GcalHelper()
+        self.calHelper = GcalHelper(client=client, eventSync=eventSync, taskSync=taskSync, batch=batch)
+        self.metrics = Metrics.get_instance()
 
     def get_day_in_cal(self, startDate, eventDate):
         delta = eventDate - startDate
@@ -34,27 +39,17 @@ class GcalModule:
     def get_events(self, currDate, calendars, calStartDatetime, calEndDatetime, displayTZ, numDays):
         eventList = self.calHelper.retrieve_events(calendars, calStartDatetime, calEndDatetime, displayTZ)
         # self.calHelper.list_calendars()
+        with self.metrics.timer('bucket_events'):
+            return self.bucket_events(currDate, eventList, numDays)
 
-        # check if event stretches across multiple days
-        calList = []
-        for i in range(numDays):
-            calList.append([])
-        for event in eventList:
-            idx = self.get_day_in_cal(currDate, event['startDatetime'].date())
-            if event['isMultiday']:
-                end_idx = self.get_day_in_cal(currDate, event['endDatetime'].date())
-                if idx < 0:
-                    idx = 0
-                if end_idx >= len(calList):
-                    end_idx = len(calList) - 1
-                for i in range(idx, end_idx + 1):
-                    calList[i].append(event)
-            elif idx >= 0:
-                calList[idx].append(event)
+    def bucket_events(self, currDate, eventList, numDays):
+        # One view per day over the sorted events, multi-day events are carried across the days they span
+        return daybuckets.bucket_events(currDate, eventList, numDays)
 
-        return calList
-    
     def get_tasks(self, currDate, tasklists, calStartDatetime, calEndDatetime, displayTZ, numDays):
+        if self.calHelper.taskSync == 'incremental':
+            return self.get_indexed_tasks(currDate, tasklists, displayTZ, numDays)
+
         taskList = self.calHelper.retrieve_tasks(tasklists, calStartDatetime, calEndDatetime, displayTZ)
         # self.calHelper.list_tasks()
 
@@ -63,8 +58,24 @@ class GcalModule:
         for i in range(numDays):
             tskList.append([])
         for task in taskList:
-            idx = self.get_day_in_cal(currDate, task['date'].date())
+            idx = self.get_day_in_cal(currDate, task.date.date())
             if idx >= 0:
                 tskList[idx].append(task)
 
-        return tskList
\ No newline at end of file
+        return tskList
+
+    def get_indexed_tasks(self, currDate, tasklists, displayTZ, numDays):
+        # the task indexes are already bucketed by due date, so each day is read directly
+        indexes = self.calHelper.sync_tasks(tasklists)
+
+        tskList = []
+        for i in range(numDays):
+            day = currDate + datetime.timedelta(days=i)
+            dayDatetime = displayTZ.localize(datetime.datetime.combine(day, datetime.datetime.min.time()))
+            tasks = []
+            for index in indexes:
+                for task in index.get_day(day):
+                    tasks.append(TaskRecord(task['title'], dayDatetime))
+            tskList.append(tasks)
+
+        return tskList
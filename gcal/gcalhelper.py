@@ -7,44 +7,43 @@ credentials.json and token.pickle in the same folder as this file. If not, run q
 
 from __future__ import print_function
 import datetime as dt
-import pickle
-import os.path
+import operator
 import pathlib
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
+from gcal.gclient import GoogleClient
+from gcal.eventstore import EventStore
+from gcal.taskindex import TaskIndex
+from gcal.records import TimeNormalizer
+from metrics.metrics import Metrics
 import logging
 
 
 class GcalHelper:
 
-    def __init__(self):
+    def __init__(self, client=None, eventSync='full', taskSync='full', batch=False, syncHorizonDays=30,
+                 taskResyncDays=7):
         self.logger = logging.getLogger('maginkdash')
-        # Initialise the Google Calendar using the provided credentials and token
-        SCOPES = ['https://www.googleapis.com/auth/calendar.readonly', 'https://www.googleapis.com/auth/tasks.readonly']
         self.currPath = str(pathlib.Path(__file__).parent.absolute())
+        # Reuse the process wide Google client, it keeps the credentials and the built services between runs
+        self.client = client if client is not None else GoogleClient.get_instance()
+        self.service = self.client.service
+        self.tasks_service = self.client.tasks_service
 
-        creds = None
-        # The file token.pickle stores the user's access and refresh tokens, and is
-        # created automatically when the authorization flow completes for the first
-        # time.
-        if os.path.exists(self.currPath + '/token/token.pickle'):
-            with open(self.currPath + '/token/token.pickle', 'rb') as token:
-                creds = pickle.load(token)
-        # If there are no (valid) credentials available, let the user log in.
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    self.currPath + '/credentials.json', SCOPES)
-                creds = flow.run_local_server(port=0)
-            # Save the credentials for the next run
-            with open(self.currPath + '/token/token.pickle', 'wb') as token:
-                pickle.dump(creds, token)
-
-        self.service = build('calendar', 'v3', credentials=creds, cache_discovery=False)
-        self.tasks_service = build('tasks', 'v1', credentials=creds, cache_discovery=False)
+        # 'full' downloads the whole window every run, 'incremental' keeps a local event store per calendar
+        # that is updated with sync tokens and only resynced once the window moves past the synced range
+        self.eventSync = eventSync
+        self.syncHorizon = dt.timedelta(days=syncHorizonDays)
+        self.syncDir = self.currPath + '/sync'
+        self.eventStores = {}
+        self.parsedEvents = {}
+        self.normalizers = {}
+        # Tasks work the same way with 'incremental', using updatedMin against a local index bucketed by due date
+        self.taskSync = taskSync
+        self.taskResync = dt.timedelta(days=taskResyncDays)
+        self.taskIndexes = {}
+        # When batching, all list calls of a run for one API go out in a single HTTP batch request
+        self.batch = batch
+        self.metrics = Metrics.get_instance()
 
     def list_calendars(self):
         # helps to retrieve ID for calendars within the account
@@ -73,23 +72,135 @@ class GcalHelper:
             cal_id = tasklist['id']
             self.logger.info("%s\t%s" % (summary, cal_id))
 
-    def to_datetime(self, isoDatetime, localTZ):
-        # replace Z with +00:00 is a workaround until datetime library decides what to do with the Z notation
-        to_datetime = dt.datetime.fromisoformat(isoDatetime.replace('Z', '+00:00'))
-        return to_datetime.astimezone(localTZ)
-
-    def adjust_end_time(self, endTime, localTZ):
-        # check if end time is at 00:00 of next day, if so set to max time for day before
-        if endTime.hour == 0 and endTime.minute == 0 and endTime.second == 0:
-            newEndtime = localTZ.localize(
-                dt.datetime.combine(endTime.date() - dt.timedelta(days=1), dt.datetime.max.time()))
-            return newEndtime
-        else:
-            return endTime
+    def get_normalizer(self, localTZ):
+        # Kept between runs, so the memoized timezone offsets are reused
+        if localTZ not in self.normalizers:
+            self.normalizers[localTZ] = TimeNormalizer(localTZ)
+        return self.normalizers[localTZ]
+
+    def execute_all(self, service, requests):
+        # Execute a dict of requests and return a dict of (result, error) per key. A failing call only
+        # affects its own key, so one broken calendar can't take down the others.
+        responses = {}
+        if not self.batch:
+            for key, request in requests.items():
+                try:
+                    responses[key] = (request.execute(), None)
+                except HttpError as e:
+                    responses[key] = (None, e)
+            return responses
+
+        keys = list(requests)
+
+        def callback(request_id, response, exception):
+            responses[keys[int(request_id)]] = (response, exception)
+
+        # Google caps a batch at 50 calls
+        for chunkStart in range(0, len(keys), 50):
+            batch = service.new_batch_http_request(callback=callback)
+            for i in range(chunkStart, min(chunkStart + 50, len(keys))):
+                batch.add(requests[keys[i]], request_id=str(i))
+            batch.execute()
+        return responses
+
+    def list_pages(self, service, listMethod, argsByKey):
+        # Run one list call per key and follow nextPageToken until the last page of each, busy calendars don't
+        # fit in a single response. Every round only costs a single round trip when batching.
+        items = {key: [] for key in argsByKey}
+        lastPages = {}
+        errors = {}
+        pending = dict(argsByKey)
+        while pending:
+            responses = self.execute_all(service, {key: listMethod(**kwargs) for key, kwargs in pending.items()})
+            nextPending = {}
+            for key, (result, error) in responses.items():
+                if error is not None:
+                    errors[key] = error
+                    continue
+                items[key] += result.get('items', [])
+                if result.get('nextPageToken'):
+                    nextPending[key] = dict(pending[key], pageToken=result['nextPageToken'])
+                else:
+                    lastPages[key] = result
+            pending = nextPending
+
+        for key in errors:
+            items.pop(key)
+        return items, lastPages, errors
 
-    def is_multiday(self, start, end):
-        # check if event stretches across multiple days
-        return start.date() != end.date()
+    def get_event_store(self, calendarId):
+        if calendarId not in self.eventStores:
+            self.eventStores[calendarId] = EventStore(self.syncDir, calendarId)
+        return self.eventStores[calendarId]
+
+    def sync_calendars(self, stores, startDatetime, endDatetime):
+        # Bring the event stores up to date, returns the number of changed events per calendar
+        changed = {}
+        resync = [store for store in stores if not store.covers(startDatetime, endDatetime)]
+        current = {store.calendarId: store for store in stores if store not in resync}
+
+        items, lastPages, errors = self.list_pages(
+            self.service, self.service.events().list,
+            {cal: dict(calendarId=cal, syncToken=store.syncToken, singleEvents=True) for cal, store in current.items()})
+        for cal, error in errors.items():
+            if error.resp.status == 410:
+                self.logger.info('Sync token for calendar {0} is no longer valid, resyncing'.format(cal))
+                resync.append(current[cal])
+            else:
+                # The events stored so far are still shown
+                self.logger.error('Failed to sync calendar {0}: {1}'.format(cal, error))
+        for cal, calItems in items.items():
+            store = current[cal]
+            changed[cal] = store.apply(calItems)
+            store.syncToken = lastPages[cal].get('nextSyncToken')
+            store.save()
+
+        # Full sync over a range a bit longer than the window, so that the token stays usable for the coming days
+        timeMin = EventStore.to_utc_str(startDatetime)
+        timeMax = EventStore.to_utc_str(max(endDatetime, startDatetime + self.syncHorizon))
+        items, lastPages, errors = self.list_pages(
+            self.service, self.service.events().list,
+            {store.calendarId: dict(calendarId=store.calendarId, timeMin=timeMin, timeMax=timeMax,
+                                    singleEvents=True) for store in resync})
+        for cal, error in errors.items():
+            self.logger.error('Failed to sync calendar {0}: {1}'.format(cal, error))
+        for store in resync:
+            if store.calendarId not in items:
+                continue
+            store.reset(timeMin, timeMax)
+            changed[store.calendarId] = store.apply(items[store.calendarId])
+            store.syncToken = lastPages[store.calendarId].get('nextSyncToken')
+            store.save()
+        return changed
+
+    def sync_events(self, calendars, startDatetime, endDatetime, localTZ):
+        event_list = []
+        parsedEvents = {}
+        normalizer = self.get_normalizer(localTZ)
+        stores = [self.get_event_store(cal) for cal in calendars]
+        changed = self.sync_calendars(stores, startDatetime, endDatetime)
+        with self.metrics.timer('normalize_events'):
+            for store in stores:
+                cal = store.calendarId
+                self.logger.info('Calendar {0}: {1} changed events, {2} stored'.format(cal, changed.get(cal, 0),
+                                                                                     len(store.items)))
+
+                for eventId, event in store.items.items():
+                    # Only events that changed since the last run have to be converted again
+                    key = (cal, eventId)
+                    cached = self.parsedEvents.get(key)
+                    if cached is None or cached[0] != event['updated'] or cached[1] is not localTZ:
+                        cached = (event['updated'], localTZ, normalizer.to_event(event))
+                    parsedEvents[key] = cached
+                    new_event = cached[2]
+                    if new_event.endDatetime >= startDatetime and new_event.startDatetime <= endDatetime:
+                        event_list.append(new_event)
+
+        # Deleted events drop out of the cache here
+        self.parsedEvents = parsedEvents
+        if not event_list:
+            self.logger.info('No upcoming events found.')
+        return normalizer.merge([event_list], operator.attrgetter('startDatetime'))
 
     def retrieve_events(self, calendars, startDatetime, endDatetime, localTZ):
         # Call the Google Calendar API and return a list of events that fall within the specified dates
@@ -100,47 +211,24 @@ class GcalHelper:
         if False:
             return event_list
 
+        self.client.ensure_fresh()
         self.logger.info('Retrieving events between ' + min_time_str + ' and ' + max_time_str + '...')
-        events_result = []
-        for cal in calendars:
-            events_result.append(
-                self.service.events().list(calendarId=cal, timeMin=min_time_str,
-                                           timeMax=max_time_str, singleEvents=True,
-                                           orderBy='startTime').execute()
-            )
-
-        events = []
-        for eve in events_result:
-            events += eve.get('items', [])
-            # events = events_result.get('items', [])
-
-        if not events:
-            self.logger.info('No upcoming events found.')
-        for event in events:
-            # extracting and converting events data into a new list
-            new_event = {'summary': event['summary']}
-
-            if event['start'].get('dateTime') is None:
-                new_event['allday'] = True
-                new_event['startDatetime'] = self.to_datetime(event['start'].get('date'), localTZ)
-            else:
-                new_event['allday'] = False
-                new_event['startDatetime'] = self.to_datetime(event['start'].get('dateTime'), localTZ)
-
-            if event['end'].get('dateTime') is None:
-                new_event['endDatetime'] = self.adjust_end_time(self.to_datetime(event['end'].get('date'), localTZ),
-                                                               localTZ)
-            else:
-                new_event['endDatetime'] = self.adjust_end_time(self.to_datetime(event['end'].get('dateTime'), localTZ),
-                                                               localTZ)
+        if self.eventSync == 'incremental':
+            event_list = self.sync_events(calendars, startDatetime, endDatetime, localTZ)
+        else:
+            events_result, _, errors = self.list_pages(
+                self.service, self.service.events().list,
+                {cal: dict(calendarId=cal, timeMin=min_time_str, timeMax=max_time_str, singleEvents=True,
+                           orderBy='startTime') for cal in calendars})
+            for cal, error in errors.items():
+                self.logger.error('Failed to retrieve events of calendar {0}: {1}'.format(cal, error))
 
-            new_event['updatedDatetime'] = self.to_datetime(event['updated'], localTZ)
-            new_event['isMultiday'] = self.is_multiday(new_event['startDatetime'], new_event['endDatetime'])
-            event_list.append(new_event)
+            if not any(events_result.values()):
+                self.logger.info('No upcoming events found.')
+            with self.metrics.timer('normalize_events'):
+                # Every calendar is listed in start order, the records of all of them are merged into one sorted list
+                event_list = self.get_normalizer(localTZ).to_events([events_result.get(cal, []) for cal in calendars])
 
-        # We need to sort eventList because the event will be sorted in "calendar order" instead of hours order
-        # TODO: improve because of double cycle for now is not much cost
-        event_list = sorted(event_list, key=lambda k: k['startDatetime'])
         return event_list
 
     def retrieve_tasks(self, tasklists, startDatetime, endDatetime, localTZ):
@@ -149,31 +237,63 @@ class GcalHelper:
 
         min_time_str = startDatetime.isoformat()
         max_time_str = endDatetime.isoformat()
-        
+        self.client.ensure_fresh()
+
         self.logger.info('Retrieving tasks timed between ' + min_time_str + ' and ' + max_time_str + '...')
-        tasks_result = []
-        for tl in tasklists:
-            tasks_result.append(
-                self.tasks_service.tasks().list(tasklist=tl, dueMin=min_time_str,
-                                           dueMax=max_time_str).execute()
-            )
-            
-        tasks = []
-        for tsk in tasks_result:
-            tasks += tsk.get('items', [])
-        
-        if not tasks:
+        tasks_result, _, errors = self.list_pages(
+            self.tasks_service, self.tasks_service.tasks().list,
+            {tl: dict(tasklist=tl, dueMin=min_time_str, dueMax=max_time_str) for tl in tasklists})
+        for tl, error in errors.items():
+            self.logger.error('Failed to retrieve tasks of task list {0}: {1}'.format(tl, error))
+
+        if not any(tasks_result.values()):
             self.logger.info('No upcoming tasks found.')
-        for task in tasks:
-            # extracting and converting events data into a new list
-            new_task = {'title': task['title']}
-            
-            new_task['date'] = self.to_datetime(task['due'], localTZ)
-            
-            task_list.append(new_task)
-            
-        # We need to sort eventList because the event will be sorted in "calendar order" instead of hours order
-        # TODO: improve because of double cycle for now is not much cost
-        task_list = sorted(task_list, key=lambda k: k['date'])
+        with self.metrics.timer('normalize_tasks'):
+            # Merged into one list sorted by due date
+            task_list = self.get_normalizer(localTZ).to_tasks([tasks_result.get(tl, []) for tl in tasklists])
+
         return task_list
-            
\ No newline at end of file
+
+    def get_task_index(self, tasklistId):
+        if tasklistId not in self.taskIndexes:
+            self.taskIndexes[tasklistId] = TaskIndex(self.syncDir, tasklistId)
+        return self.taskIndexes[tasklistId]
+
+    def sync_tasks(self, tasklists):
+        # Bring the task indexes up to date, completed and deleted tasks have to be listed too in incremental
+        # requests, otherwise they would never leave the index
+        self.client.ensure_fresh()
+        self.logger.info('Syncing tasks...')
+        now = dt.datetime.now(dt.timezone.utc)
+        # Leave some slack for clock differences with the server, applying a task twice is harmless
+        syncStart = (now - dt.timedelta(minutes=1)).isoformat()
+
+        indexes = [self.get_task_index(tl) for tl in tasklists]
+        requests = {}
+        for index in indexes:
+            if index.lastSync is not None and index.fullSync is not None and \
+                    now - dt.datetime.fromisoformat(index.fullSync) < self.taskResync:
+                requests[index.tasklistId] = dict(tasklist=index.tasklistId, updatedMin=index.lastSync,
+                                                  showCompleted=True, showDeleted=True, showHidden=True,
+                                                  maxResults=100)
+            else:
+                # Full reload every few days, deleted tasks are not guaranteed to be reported forever
+                requests[index.tasklistId] = dict(tasklist=index.tasklistId, showCompleted=False, maxResults=100)
+
+        items, _, errors = self.list_pages(self.tasks_service, self.tasks_service.tasks().list, requests)
+        for tl, error in errors.items():
+            # The tasks indexed so far are still shown
+            self.logger.error('Failed to sync task list {0}: {1}'.format(tl, error))
+
+        for index in indexes:
+            tl = index.tasklistId
+            if tl not in items:
+                continue
+            if 'updatedMin' not in requests[tl]:
+                index.reset()
+                index.fullSync = now.isoformat()
+            changed = index.apply(items[tl])
+            index.lastSync = syncStart
+            index.save()
+            self.logger.info('Task list {0}: {1} changed tasks, {2} open'.format(tl, changed, len(index.tasks)))
+        return indexes
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This is the Google API client shared by everything in the process. The credentials are loaded from token.pickle once,
+kept in memory and refreshed ahead of their expiry, and the Calendar and Tasks services are built a single time from
+a discovery document found on disk instead of being rebuilt for every dashboard update.
+"""
+
+import datetime as dt
+import json
+import logging
+import os.path
+import pathlib
+import pickle
+import threading
+import httplib2
+import google_auth_httplib2
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import HttpRequest
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+
+# If modifying these scopes, delete the file token.pickle.
+SCOPES = ['https://www.googleapis.com/auth/calendar.readonly', 'https://www.googleapis.com/auth/tasks.readonly']
+
+
+class GoogleClient:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        # One authenticated client per process
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self, refresh_margin=300, creds=None, rootUrl=None, transport=None):
+        self.logger = logging.getLogger('maginkdash')
+        self.currPath = str(pathlib.Path(__file__).parent.absolute())
+        self.tokenFile = self.currPath + '/token/token.pickle'
+        self.discoveryDir = self.currPath + '/discovery'
+        self.refreshMargin = dt.timedelta(seconds=refresh_margin)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # Sends every Calendar and Tasks call to another server, e.g. the local stand-ins of the benchmark
+        self.rootUrl = rootUrl
+        # Called with every authorized connection, returns what the requests go through instead, e.g. the recording
+        # or replaying wrappers of a recorded run
+        self.transport = transport
+
+        self.creds = creds if creds is not None else self._load_credentials()
+        self.service = self._build_service('calendar', 'v3')
+        self.tasks_service = self._build_service('tasks', 'v1')
+
+    def _load_credentials(self):
+        creds = None
+        # The file token.pickle stores the user's access and refresh tokens, and is
+        # created automatically when the authorization flow completes for the first
+        # time.
+        if os.path.exists(self.tokenFile):
+            with open(self.tokenFile, 'rb') as token:
+                creds = pickle.load(token)
+        # If there are no (valid) credentials available, let the user log in.
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    self.currPath + '/credentials.json', SCOPES)
+                creds = flow.run_local_server(port=0)
+            self._save_credentials(creds)
+        return creds
+
+    def _save_credentials(self, creds):
+        # Save the credentials for the next run
+        with open(self.tokenFile, 'wb') as token:
+            pickle.dump(creds, token)
+
+    def ensure_fresh(self):
+        # Refresh the access token a few minutes before it expires rather than on the first failed request
+        with self.lock:
+            expiry = self.creds.expiry  # naive UTC
+            if expiry is None or not self.creds.refresh_token:
+                return
+            if expiry - dt.datetime.utcnow() > self.refreshMargin:
+                return
+            self.logger.info('Refreshing Google credentials')
+            self.creds.refresh(Request())
+            self._save_credentials(self.creds)
+
+    def _get_http(self):
+        # httplib2 is not thread-safe, so every thread keeps its own authorized connection
+        http = getattr(self.local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http(timeout=30))
+            if self.transport is not None:
+                http = self.transport(http)
+            self.local.http = http
+        return http
+
+    def _build_request(self, http, *args, **kwargs):
+        return HttpRequest(self._get_http(), *args, **kwargs)
+
+    def _get_discovery_doc(self, serviceName, version):
+        # A document placed in the discovery folder takes precedence over the one bundled with googleapiclient
+        docFile = '{0}/{1}.{2}.json'.format(self.discoveryDir, serviceName, version)
+        if os.path.exists(docFile):
+            with open(docFile, 'r') as file:
+                return file.read()
+        return get_static_doc(serviceName, version)
+
+    def _build_service(self, serviceName, version):
+        doc = self._get_discovery_doc(serviceName, version)
+        if doc is None:
+            self.logger.info('No cached discovery document for {0} {1}, fetching it'.format(serviceName, version))
+            return build(serviceName, version, http=self._get_http(), requestBuilder=self._build_request,
+                         cache_discovery=False)
+        doc = json.loads(doc)
+        if self.rootUrl is not None:
+            doc['rootUrl'] = self.rootUrl
+            doc['baseUrl'] = self.rootUrl + doc['servicePath']
+        return build_from_document(doc, http=self._get_http(), requestBuilder=self._build_request)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+These are the event and task records the calendar sources return, and the normalizer that builds them from the API
+items. A record only has slots for the fields the dashboard uses instead of a dict per item, and can still be read
+like the dicts it replaces (event['summary']). The normalizer converts every distinct timestamp string once (events
+share a lot of start and end times) with the display timezone offset memoized per UTC quarter hour, so the timezone
+rules are only looked up a few times per day of events instead of once or twice per timestamp.
+"""
+
+import datetime as dt
+import operator
+
+# Converted timestamps kept before the memo is cleared, calendars repeat the same start and end times a lot
+MAX_TIMES = 50000
+
+
+class Record:
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def keys(self):
+        return self.__slots__
+
+    def values(self):
+        return tuple(getattr(self, key) for key in self.__slots__)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.values() == other.values()
+
+    __hash__ = None
+
+    def __repr__(self):
+        # Stable between runs, the scheduler compares results by their repr
+        return '{0}({1})'.format(type(self).__name__,
+                                 ', '.join('{0}={1!r}'.format(key, getattr(self, key)) for key in self.__slots__))
+
+    def __getstate__(self):
+        return self.values()
+
+    def __setstate__(self, state):
+        for key, value in zip(self.__slots__, state):
+            setattr(self, key, value)
+
+
+class EventRecord(Record):
+    # updated is kept as the raw API string, nothing on the dashboard needs it parsed
+    __slots__ = ('summary', 'allday', 'startDatetime', 'endDatetime', 'isMultiday', 'updated')
+
+    def __init__(self, summary, allday, startDatetime, endDatetime, updated=None):
+        self.summary = summary
+        self.allday = allday
+        self.startDatetime = startDatetime
+        self.endDatetime = endDatetime
+        # check if event stretches across multiple days
+        self.isMultiday = startDatetime.date() != endDatetime.date()
+        self.updated = updated
+
+    @property
+    def updatedDatetime(self):
+        return None if self.updated is None else dt.datetime.fromisoformat(self.updated.replace('Z', '+00:00'))
+
+
+class TaskRecord(Record):
+    __slots__ = ('title', 'date')
+
+    def __init__(self, title, date):
+        self.title = title
+        self.date = date
+
+
+class TimeNormalizer:
+
+    def __init__(self, localTZ):
+        self.localTZ = localTZ
+        # timestamp string: datetime in the display timezone
+        self.times = {}
+        # (UTC date, hour, quarter): (utc offset, tzinfo) of the display timezone in that quarter hour
+        self.offsets = {}
+        # date string: (start of the day, end of the day before) in the display timezone
+        self.days = {}
+
+    def to_local(self, isoDatetime):
+        local = self.times.get(isoDatetime)
+        if local is None:
+            if len(self.times) >= MAX_TIMES:
+                self.times.clear()
+            local = self.times[isoDatetime] = self.convert(isoDatetime)
+        return local
+
+    def convert(self, isoDatetime):
+        # replace Z with +00:00 is a workaround until datetime library decides what to do with the Z notation
+        parsed = dt.datetime.fromisoformat(isoDatetime.replace('Z', '+00:00'))
+        utc = parsed.replace(tzinfo=None) - parsed.utcoffset()
+        key = (utc.date(), utc.hour, utc.minute // 15)
+        entry = self.offsets.get(key)
+        if entry is None:
+            # Timezone rules change on a quarter hour in UTC (on the half hour in e.g. Adelaide or St. John's), so one
+            # lookup covers every timestamp of the same quarter hour
+            local = utc.replace(tzinfo=dt.timezone.utc).astimezone(self.localTZ)
+            entry = self.offsets[key] = (local.utcoffset(), local.tzinfo)
+        return (utc + entry[0]).replace(tzinfo=entry[1])
+
+    def get_day(self, isoDate):
+        entry = self.days.get(isoDate)
+        if entry is None:
+            date = dt.date.fromisoformat(isoDate)
+            entry = self.days[isoDate] = (self.localize(date, dt.time.min),
+                                          self.localize(date - dt.timedelta(days=1), dt.time.max))
+        return entry
+
+    def localize(self, date, time):
+        naive = dt.datetime.combine(date, time)
+        if hasattr(self.localTZ, 'localize'):
+            return self.localTZ.localize(naive)
+        return naive.replace(tzinfo=self.localTZ)
+
+    def to_end_time(self, isoDatetime):
+        # An end time at 00:00 belongs to the day before, it is moved to the max time of that day
+        endTime = self.to_local(isoDatetime)
+        if endTime.hour == 0 and endTime.minute == 0 and endTime.second == 0:
+            return self.get_day(endTime.date().isoformat())[1]
+        return endTime
+
+    def to_event(self, event):
+        start = event['start']
+        end = event['end']
+        if 'dateTime' in start:
+            allday = False
+            startDatetime = self.to_local(start['dateTime'])
+        else:
+            # All day events start at midnight in the display timezone
+            allday = True
+            startDatetime = self.get_day(start['date'])[0]
+        if 'dateTime' in end:
+            endDatetime = self.to_end_time(end['dateTime'])
+        else:
+            endDatetime = self.get_day(end['date'])[1]
+        return EventRecord(event['summary'], allday, startDatetime, endDatetime, event.get('updated'))
+
+    def to_task(self, task):
+        return TaskRecord(task['title'], self.to_local(task['due']))
+
+    @staticmethod
+    def merge(runs, key):
+        # The runs (e.g. the records of each calendar) are mostly in start order already as the API lists them, and
+        # the sort finds and merges those runs instead of sorting from scratch
+        return sorted((record for run in runs for record in run), key=key)
+
+    def to_events(self, runs):
+        # runs is a list of API item lists, returns one list of event records sorted by start
+        return self.merge([[self.to_event(event) for event in run] for run in runs],
+                          operator.attrgetter('startDatetime'))
+
+    def to_tasks(self, runs):
+        return self.merge([[self.to_task(task) for task in run] for run in runs], operator.attrgetter('date'))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This is where the open tasks of a task list are kept between runs when incremental sync is enabled. The index is
+stored as JSON next to the calendar event stores and keeps the tasks bucketed by their due date, so the dashboard can
+read a day straight from it after applying only the tasks updated since the last sync.
+"""
+
+import hashlib
+import json
+import os
+import os.path
+
+
+class TaskIndex:
+
+    def __init__(self, storeDir, tasklistId):
+        self.tasklistId = tasklistId
+        self.file = '{0}/tasks-{1}.json'.format(storeDir, hashlib.sha1(tasklistId.encode('utf-8')).hexdigest())
+        self.lastSync = None
+        self.fullSync = None
+        self.tasks = {}
+        self.byDue = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.file):
+            return
+        with open(self.file, 'r') as file:
+            data = json.load(file)
+        self.lastSync = data.get('lastSync')
+        self.fullSync = data.get('fullSync')
+        self.tasks = data.get('tasks', {})
+        # The due date buckets are rebuilt on load rather than stored twice
+        self.byDue = {}
+        for taskId, task in self.tasks.items():
+            self.byDue.setdefault(task['dueDate'], []).append(taskId)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.file), exist_ok=True)
+        tmpFile = self.file + '.tmp'
+        with open(tmpFile, 'w') as file:
+            json.dump({'tasklistId': self.tasklistId, 'lastSync': self.lastSync, 'fullSync': self.fullSync,
+                       'tasks': self.tasks}, file)
+        os.replace(tmpFile, self.file)
+
+    def reset(self):
+        self.lastSync = None
+        self.fullSync = None
+        self.tasks = {}
+        self.byDue = {}
+
+    def remove(self, taskId):
+        task = self.tasks.pop(taskId, None)
+        if task is None:
+            return False
+        bucket = self.byDue[task['dueDate']]
+        bucket.remove(taskId)
+        if not bucket:
+            del self.byDue[task['dueDate']]
+        return True
+
+    def apply(self, items):
+        # Completed, deleted, hidden and undated tasks are not shown, so they are dropped from the index
+        changed = 0
+        for item in items:
+            if item.get('deleted') or item.get('hidden') or item.get('status') == 'completed' or not item.get('due'):
+                if self.remove(item['id']):
+                    changed += 1
+                continue
+
+            self.remove(item['id'])
+            # The time portion of a due date is always discarded by the Tasks API
+            task = {'title': item['title'], 'due': item['due'], 'dueDate': item['due'][:10], 'updated': item['updated']}
+            self.tasks[item['id']] = task
+            self.byDue.setdefault(task['dueDate'], []).append(item['id'])
+            changed += 1
+        return changed
+
+    def get_day(self, date):
+        return [self.tasks[taskId] for taskId in self.byDue.get(date.isoformat(), [])]
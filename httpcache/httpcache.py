@@ -0,0 +1,130 @@
+"""
+This is the HTTP layer shared by the OpenWeatherMap, Memos and DumbDo modules. All requests go through one pooled
+requests.Session, and every response is cached on disk for a per-source time to live. Once an entry expires it is
+revalidated with ETag/Last-Modified when the server supports it, so unchanged data is not downloaded again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import os.path
+import pathlib
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from metrics.metrics import Metrics
+
+# Seconds a response stays fresh, OWM One Call only changes about every 10 minutes
+DEFAULT_TTLS = {'owm': 600, 'memos': 60, 'dumbdo': 60}
+
+
+class HttpCache:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @classmethod
+    def set_instance(cls, instance):
+        with cls._instance_lock:
+            cls._instance = instance
+
+    def __init__(self, cacheFile=None, ttls=None, adapter=None, persist=True):
+        self.logger = logging.getLogger('maginkdash')
+        self.currPath = str(pathlib.Path(__file__).parent.absolute())
+        self.cacheFile = cacheFile if cacheFile is not None else self.currPath + '/cache/httpcache.json'
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0}
+        self.metrics = Metrics.get_instance()
+
+        self.session = requests.Session()
+        # Another transport can be given, e.g. the recording or replaying adapters of a recorded run
+        if adapter is None:
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Without persist the cache starts empty and is only kept in memory
+        self.persist = persist
+        self.entries = {}
+        if persist:
+            self.load()
+
+    def load(self):
+        if not os.path.exists(self.cacheFile):
+            return
+        try:
+            with open(self.cacheFile, 'r') as file:
+                self.entries = json.load(file)
+        except ValueError:
+            self.logger.info('HTTP cache file is corrupt, starting with an empty cache')
+
+    def save(self):
+        # Called with the lock held
+        if not self.persist:
+            return
+        os.makedirs(os.path.dirname(self.cacheFile), exist_ok=True)
+        tmpFile = self.cacheFile + '.tmp'
+        with open(tmpFile, 'w') as file:
+            json.dump(self.entries, file)
+        os.replace(tmpFile, self.cacheFile)
+
+    def get_key(self, url, params, headers, variant=None):
+        # The key covers credentials too, so it is hashed rather than stored in clear
+        raw = json.dumps([url, sorted((params or {}).items()), sorted((headers or {}).items())] +
+                         ([variant] if variant is not None else []))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get_json(self, source, url, params=None, headers=None, timeout=10, parse=None, variant=None):
+        # Return the decoded payload of a GET request, from cache while it is fresh. parse receives the
+        # response and returns what should be cached, by default the whole JSON body. variant names what parse
+        # extracts when it depends on more than the request, so different extracts are cached apart.
+        key = self.get_key(url, params, headers, variant)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry['fetched'] < self.ttls.get(source, 0):
+                self.stats['hits'] += 1
+                self.metrics.inc('http_cache', source=source, result='hit')
+                return entry['payload']
+
+        requestHeaders = dict(headers or {})
+        if entry is not None:
+            if entry.get('etag'):
+                requestHeaders['If-None-Match'] = entry['etag']
+            if entry.get('lastModified'):
+                requestHeaders['If-Modified-Since'] = entry['lastModified']
+
+        r = self.session.get(url, params=params, headers=requestHeaders, timeout=timeout, stream=True)
+        try:
+            if r.status_code == 304 and entry is not None:
+                with self.lock:
+                    entry['fetched'] = now
+                    self.stats['revalidated'] += 1
+                    self.save()
+                self.metrics.inc('http_cache', source=source, result='revalidated')
+                return entry['payload']
+
+            r.raise_for_status()
+            payload = parse(r) if parse is not None else r.json()
+            # Bytes actually read from the connection, a parser that stops early reads less than the whole body
+            self.metrics.inc('http_bytes', r.raw.tell(), source=source)
+        finally:
+            r.close()
+
+        with self.lock:
+            self.entries[key] = {'source': source, 'fetched': now, 'etag': r.headers.get('ETag'),
+                                 'lastModified': r.headers.get('Last-Modified'), 'payload': payload}
+            self.stats['misses'] += 1
+            self.save()
+        self.metrics.inc('http_cache', source=source, result='miss')
+        return payload
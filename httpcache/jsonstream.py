@@ -0,0 +1,98 @@
+"""
+This reads one member of a JSON object from a response as it streams in. Members are decoded one at a time and the
+ones before the wanted member are dropped right away, and reading stops as soon as the member is complete, so only one
+member is ever held in memory and nothing after it is downloaded.
+"""
+
+import codecs
+import json
+import re
+
+WHITESPACE_RE = re.compile(r'\s*')
+DECODER = json.JSONDecoder()
+NUMBER_END = ' \t\r\n,]}'
+
+
+class JsonStreamError(ValueError):
+    pass
+
+
+class JsonMemberReader:
+
+    def __init__(self, chunks):
+        # chunks is an iterable of bytes, e.g. response.iter_content()
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.done = False
+
+    def read_more(self):
+        # Appends the next chunk to the buffer and drops what was consumed already, False at the end of the stream
+        if self.done:
+            return False
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.done = True
+            chunk = b''
+        self.buffer = self.buffer[self.pos:] + self.decoder.decode(chunk, final=self.done)
+        self.pos = 0
+        return True
+
+    def expect(self, chars):
+        # Skips whitespace and returns the next character, which has to be one of chars
+        while True:
+            self.pos = WHITESPACE_RE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                break
+            if not self.read_more():
+                raise JsonStreamError('Unexpected end of JSON, expected one of ' + chars)
+        char = self.buffer[self.pos]
+        if char not in chars:
+            raise JsonStreamError('Unexpected {0!r} in JSON, expected one of {1}'.format(char, chars))
+        self.pos += 1
+        return char
+
+    def read_value(self):
+        # Decodes the next value, reading more until it is complete. An incomplete value is only tried again once the
+        # buffer has doubled, so a value spread over many chunks is still decoded in linear time.
+        tried = 0
+        while True:
+            self.pos = WHITESPACE_RE.match(self.buffer, self.pos).end()
+            available = len(self.buffer) - self.pos
+            if self.done or (available > 0 and available >= 2 * tried):
+                tried = available
+                try:
+                    value, end = DECODER.raw_decode(self.buffer, self.pos)
+                except ValueError:
+                    if self.done:
+                        raise JsonStreamError('Incomplete or invalid JSON value')
+                else:
+                    # A number is only complete once something other than a digit, sign, dot or exponent follows it
+                    if self.done or not isinstance(value, (int, float)) or isinstance(value, bool) or \
+                            (end < len(self.buffer) and self.buffer[end] in NUMBER_END):
+                        self.pos = end
+                        return value
+            self.read_more()
+
+    def find_member(self, name, default=None):
+        # Returns the decoded value of the member name of the top level object, or default if it has none
+        self.read_more()
+        self.expect('{')
+        if self.expect('"}') == '}':
+            return default
+        while True:
+            self.pos -= 1
+            key = self.read_value()
+            self.expect(':')
+            value = self.read_value()
+            if key == name:
+                return value
+            if self.expect(',}') == '}':
+                return default
+            self.expect('"')
+
+
+def find_member(chunks, name, default=None):
+    return JsonMemberReader(chunks).find_member(name, default)
@@ -8,6 +8,15 @@
     3. Display the image on the Inkplate 10 device
     4. (Optional) Check the battery level on the Inkplate device
     5. Set a sleep timer for 60 minutes, and allow the Inkplate to go into deep sleep to conserve battery
+
+  With the "eink" option enabled on the server, a packed raw frame (maginkdash.raw) is published next to the PNG.
+  Define USE_RAW_FRAME to stream it straight into the display buffer instead of downloading and decoding the PNG.
+  RAW_FRAME_BPP has to match the "bpp" setting of the server.
+
+  With the "frameServer" option enabled on the server, define USE_FRAME_SERVER to download the frame from it instead.
+  The ETag of the frame on the display is kept across deep sleep and sent as If-None-Match, so an unchanged frame is
+  answered with a bodyless 304 and the display is left as it is. The device then sleeps for the number of seconds the
+  server sends in X-Next-Refresh (60 minutes if it doesn't).
 */
 
 // Next 3 lines are a precaution, you can ignore those, and the example would also work without them
@@ -18,6 +27,7 @@
 #include "Inkplate.h"
 #include <WiFi.h>
 #include <WiFiClientSecure.h>
+#include <HTTPClient.h>
 #include <ArduinoJson.h>
 #include "battSymbol.h" // Include .h file that contains byte array for battery symbol.
 
@@ -27,6 +37,15 @@ const char ssid[] = "Orange_Swiatlowod_6310";    // Your WiFi SSID
 const char *password = "4LMW535RWY9E"; // Your WiFi password
 const char *imgurl = "http://192.168.1.100:30010/maginkdash/maginkdash.png"; // Your dashboard image web address
 
+// #define USE_RAW_FRAME
+#define RAW_FRAME_BPP 4
+const char *rawurl = "http://192.168.1.100:30010/maginkdash/maginkdash.raw"; // Your raw dashboard frame web address
+
+// #define USE_FRAME_SERVER
+const char *frameurl = "http://192.168.1.100:8090/maginkdash.png"; // Frame server address of the image (maginkdash.raw with USE_RAW_FRAME)
+RTC_DATA_ATTR char frameEtag[48] = ""; // ETag of the frame on the display, survives deep sleep
+uint64_t sleepSeconds = 60 * 60;
+
 // Battery values
 #define BATTV_5 4.1
 #define BATTV_4 4.0
@@ -37,6 +56,97 @@ const char *imgurl = "http://192.168.1.100:30010/maginkdash/maginkdash.png"; //
 
 WiFiClientSecure client;
 
+#ifdef USE_RAW_FRAME
+// Draw a raw frame with one gray level (0-7) per pixel, every row padded to whole bytes.
+// 4 bpp: two pixels per byte, high nibble first. 3 bpp: eight pixels in every three bytes, MSB first.
+bool drawRawStream(WiFiClient *stream)
+{
+    const int rowBytes = (E_INK_WIDTH * RAW_FRAME_BPP + 7) / 8;
+    static uint8_t row[(E_INK_WIDTH * 4 + 7) / 8];
+    for (int y = 0; y < E_INK_HEIGHT; y++)
+    {
+        if (stream->readBytes(row, rowBytes) != rowBytes)
+        {
+            return false;
+        }
+        for (int x = 0; x < E_INK_WIDTH; x++)
+        {
+#if RAW_FRAME_BPP == 4
+            uint8_t b = row[x >> 1];
+            display.drawPixel(x, y, (x & 1) ? (b & 0x0F) : (b >> 4));
+#else
+            int bit = x * 3;
+            uint16_t pair = (row[bit >> 3] << 8) | ((bit >> 3) + 1 < rowBytes ? row[(bit >> 3) + 1] : 0);
+            display.drawPixel(x, y, (pair >> (13 - (bit & 7))) & 0x07);
+#endif
+        }
+    }
+    return true;
+}
+
+bool drawRawFrame(const char *url)
+{
+    HTTPClient http;
+    http.begin(url);
+    if (http.GET() != HTTP_CODE_OK)
+    {
+        http.end();
+        return false;
+    }
+    bool drawn = drawRawStream(http.getStreamPtr());
+    http.end();
+    return drawn;
+}
+#endif
+
+#ifdef USE_FRAME_SERVER
+// Conditional download of the frame. Returns true when a new frame was drawn, false when the display already shows
+// the current one or the download failed, in both cases the display should be left as it is.
+bool drawFromFrameServer(const char *url)
+{
+    const char *headerKeys[] = {"ETag", "X-Next-Refresh"};
+    HTTPClient http;
+    http.begin(url);
+    http.collectHeaders(headerKeys, 2);
+    if (frameEtag[0] != '\0')
+    {
+        http.addHeader("If-None-Match", frameEtag);
+    }
+
+    int status = http.GET();
+    if (http.hasHeader("X-Next-Refresh") && http.header("X-Next-Refresh").toInt() > 0)
+    {
+        sleepSeconds = http.header("X-Next-Refresh").toInt();
+    }
+
+    bool drawn = false;
+    if (status == HTTP_CODE_OK)
+    {
+#ifdef USE_RAW_FRAME
+        drawn = drawRawStream(http.getStreamPtr());
+#else
+        // The PNG is read into PSRAM first, the library's drawImage(url) can't send request headers
+        int len = http.getSize();
+        uint8_t *buf = len > 0 ? (uint8_t *)ps_malloc(len) : NULL;
+        if (buf != NULL)
+        {
+            if (http.getStreamPtr()->readBytes(buf, len) == len)
+            {
+                drawn = display.drawPngFromBuffer(buf, len, 0, 0, false, false);
+            }
+            free(buf);
+        }
+#endif
+        if (drawn)
+        {
+            strlcpy(frameEtag, http.header("ETag").c_str(), sizeof(frameEtag));
+        }
+    }
+    http.end();
+    return drawn;
+}
+#endif
+
 void setup()
 {
     Serial.begin(115200);
@@ -51,34 +161,45 @@ void setup()
     }
 
     // Join wifi, retrieve image, update display
+    bool updateDisplay = true;
+#if defined(USE_FRAME_SERVER)
+    updateDisplay = drawFromFrameServer(frameurl);
+    Serial.println(updateDisplay);
+#elif defined(USE_RAW_FRAME)
+    Serial.println(drawRawFrame(rawurl));
+#else
     char url[256];
     strcpy(url, imgurl);
     Serial.println(display.drawImage(url, display.PNG, 0, 0));
+#endif
 
-    float voltage = display.readBattery();                   // Read battery voltage
-    display.setTextColor(BLACK);
-    display.setTextSize(3); 
-    display.print(voltage);
-    // if (voltage >= BATTV_5) {
-    //   display.drawImage(bat_5, 0, 0, bat_5_w, bat_5_h); // Draw battery symbol
-    // } else if (voltage >= BATTV_4) {
-    //   display.drawImage(bat_4, 0, 0, bat_4_w, bat_4_h); // Draw battery symbol
-    // } else if (voltage >= BATTV_3) {
-    //   display.drawImage(bat_3, 0, 0, bat_3_w, bat_3_h); // Draw battery symbol
-    // } else if (voltage >= BATTV_2) {
-    //   display.drawImage(bat_2, 0, 0, bat_2_w, bat_2_h); // Draw battery symbol
-    // } else if (voltage >= BATTV_1) {
-    //   display.drawImage(bat_1, 0, 0, bat_1_w, bat_1_h); // Draw battery symbol
-    // } else {
-    //   display.drawImage(bat_0, 0, 0, bat_0_w, bat_0_h); // Draw battery symbol
-    // }
-    
-    display.display();
-    
-    // Let display go to sleep to conserve battery, and wake up an hour later    
+    if (updateDisplay)
+    {
+        float voltage = display.readBattery();                   // Read battery voltage
+        display.setTextColor(BLACK);
+        display.setTextSize(3); 
+        display.print(voltage);
+        // if (voltage >= BATTV_5) {
+        //   display.drawImage(bat_5, 0, 0, bat_5_w, bat_5_h); // Draw battery symbol
+        // } else if (voltage >= BATTV_4) {
+        //   display.drawImage(bat_4, 0, 0, bat_4_w, bat_4_h); // Draw battery symbol
+        // } else if (voltage >= BATTV_3) {
+        //   display.drawImage(bat_3, 0, 0, bat_3_w, bat_3_h); // Draw battery symbol
+        // } else if (voltage >= BATTV_2) {
+        //   display.drawImage(bat_2, 0, 0, bat_2_w, bat_2_h); // Draw battery symbol
+        // } else if (voltage >= BATTV_1) {
+        //   display.drawImage(bat_1, 0, 0, bat_1_w, bat_1_h); // Draw battery symbol
+        // } else {
+        //   display.drawImage(bat_0, 0, 0, bat_0_w, bat_0_h); // Draw battery symbol
+        // }
+
+        display.display();
+    }
+
+    // Let display go to sleep to conserve battery, and wake up an hour later (or when the frame server expects a change)
     Serial.println("Going to sleep");
     delay(100);
-    esp_sleep_enable_timer_wakeup(60ll * 60 * 1000 * 1000); //wakeup in 60min time - 60min * 60s * 1000ms * 1000us
+    esp_sleep_enable_timer_wakeup(sleepSeconds * 1000 * 1000); //wakeup in 60min time - 60min * 60s * 1000ms * 1000us
     esp_deep_sleep_start();
 }
 
@@ -6,29 +6,54 @@ As a dashboard, there are many other things that could be displayed, and it can
 retrieve the information. So feel free to change up the code and amend it to your needs.
 """
 
+import time
+startTime = time.perf_counter()
+
+import argparse
+import concurrent.futures
 import datetime
 import logging
+import os
+import os.path
 import sys
 import json
 from datetime import datetime as dt
 from pytz import timezone
-from gcal.gcal import GcalModule
-from owm.owm import OWMModule
-from render.render import RenderHelper
-from memos.memos import Memos
-from dumbdo.dumbdo import Dumbdo
-import time
-import schedule
+from fetch.fetcher import Fetcher
+from fetch.align import align_days, align_weather
+from fetch.lastgood import LastGoodStore
+from scheduler.scheduler import RefreshScheduler
+from metrics.metrics import Metrics
+import threading
+
+# The Google, HTTP and imaging libraries are imported where they are first needed, so a run that finds nothing due
+# (or nothing changed) never loads them
 
 if __name__ == '__main__':
     logger = logging.getLogger('maginkdash')
 
+    parser = argparse.ArgumentParser(description='Generate the MagInkDash dashboard')
+    parser.add_argument('--once', action='store_true',
+                        help='run a single update and exit, for cron or a systemd timer, instead of staying resident')
+    parser.add_argument('--record', metavar='ARCHIVE',
+                        help='fetch every source, render and save every response and the rendered views to ARCHIVE, then exit')
+    parser.add_argument('--replay', metavar='ARCHIVE',
+                        help='run a single update answered from the responses recorded in ARCHIVE, without network access, then exit')
+    parser.add_argument('--output', default='replay/output',
+                        help='folder a replay writes its images, stats and state to, instead of the configured paths')
+    args = parser.parse_args()
+    # A recorded or replayed run is a single update as well
+    singleRun = args.once or args.record is not None or args.replay is not None
+
     # Basic configuration settings (user replaceable)
     configFile = open('config.json')
     config = json.load(configFile)
 
     calendars = config['calendars'] # Google Calendar IDs
     tasklists = config['tasklists'] # Google Task List IDs
+    calendarSync = config.get('calendarSync', 'full') # 'full' or 'incremental' (sync tokens with a local event store)
+    taskSync = config.get('taskSync', 'full') # 'full' or 'incremental' (updatedMin with a local task index)
+    googleBatch = config.get('googleBatch', False) # Send all Calendar and all Tasks list calls as one batch request each
     
     memos_config = False
     if 'memos' in config:
@@ -46,73 +71,410 @@ if __name__ == '__main__':
         exit(1)
     
     displayTZ = timezone(config['displayTZ']) # list of timezones - print(pytz.all_timezones)
-    numCalDaysToShow = config['numCalDaysToShow'] # Number of days to retrieve from gcal, keep to 3 unless other parts of the code are changed too
-    imageWidth = config['imageWidth']  # Width of image to be generated for display.
-    imageHeight = config['imageHeight']  # Height of image to be generated for display.
     lat = config["lat"] # Latitude in decimal of the location to retrieve weather forecast for
     lon = config["lon"] # Longitude in decimal of the location to retrieve weather forecast for
     owm_api_key = config["owm_api_key"]  # OpenWeatherMap API key. Required to retrieve weather forecast.
-    path_to_server_image = config["path_to_server_image"]  # Location to save the generated image
-    nginx_server_dir = config['nginx']['server_dir']  # Path to the Nginx main folder for the html files to be transferred to
-    nginx_serving_path = config['nginx']['serving_path']  # URL of the nginx for the browserless to use to render the html
-    browserless_url = config['browserless']['url']  # Browserless url
-    browserless_token = config['browserless']["token"]  # Browserless token
+    owm_url = config.get("owm_url")  # One Call endpoint, only changed to point at a proxy or a stand-in
+
+    # Dashboard profiles, one per display. All of them are rendered from the same fetched data, and any setting missing
+    # from a profile is taken from the top level of the config, which on its own describes a single dashboard.
+    #   imageWidth, imageHeight - size of the image to be generated for display
+    #   numCalDaysToShow - number of days to show, the template adds a column per day
+    #   path_to_server_image - location to save the generated image
+    #   renderer - 'browserless' (HTML screenshot) or 'native' (drawn with Pillow)
+    #   template - HTML template in the render folder (or an absolute path), for the browserless renderer
+    #   eink - optional gray level reduction of the frame, e.g. {"dither": "bayer", "bpp": 4}
+    #   framePatch - optional dirty rectangle patch against the previous frame, e.g. {"tile": 8}
+    #   frameHistory - number of previously published frames kept next to the image
+    profileDefaults = {'renderer': 'browserless', 'template': 'dashboard_template.html', 'frameHistory': 2}
+    profiles = []
+    for i, profileConfig in enumerate(config.get('dashboards', [{}])):
+        profile = {'name': None if 'dashboards' not in config else 'dashboard{0}'.format(i + 1)}
+        for key in ('imageWidth', 'imageHeight', 'numCalDaysToShow', 'path_to_server_image', 'renderer', 'template',
+                    'eink', 'framePatch', 'frameHistory'):
+            profile[key] = config.get(key, profileDefaults.get(key))
+        profile.update(profileConfig)
+        profiles.append(profile)
+    numCalDaysToShow = max(profile['numCalDaysToShow'] for profile in profiles) # Days retrieved from gcal for all profiles
+    renderConcurrency = config.get('renderConcurrency', 2)  # Profiles rendered at the same time against browserless
+
+    nginx_server_dir, nginx_serving_path, browserless_url, browserless_token = None, None, None, None
+    browserless_mode, browserless_ws = 'screenshot', None
+    if any(profile['renderer'] != 'native' for profile in profiles):
+        nginx_server_dir = config['nginx']['server_dir']  # Path to the Nginx main folder for the html files to be transferred to
+        nginx_serving_path = config['nginx']['serving_path']  # URL of the nginx for the browserless to use to render the html
+        browserless_url = config['browserless']['url']  # Browserless url
+        browserless_token = config['browserless']["token"]  # Browserless token
+        browserless_mode = config['browserless'].get('mode', 'screenshot')  # 'screenshot' (new page per frame) or 'session' (warm page)
+        browserless_ws = config['browserless'].get('ws')  # Optional DevTools WebSocket endpoint, derived from the url by default
+    deadlines = {'weather': 20, 'calendar': 60, 'tasks': 60, 'memo': 15}  # Seconds each source has to respond
+    deadlines.update(config.get('deadlines', {}))
+    httpCacheConfig = config.get('httpCache', {})  # Cache file and per-source TTLs in seconds for OWM, Memos and DumbDo
+    refreshConfig = config.get('refresh', {})  # Per-source cadences in seconds, quiet hours and the calendar refresh ahead of events
+    lastGoodConfig = config.get('lastGood', {})  # File the last good result of every source is kept in
+    stateFile = config.get('stateFile')  # Schedule and change digests carried between runs, scheduler/state/state.json by default
+    metricsConfig = config.get('metrics', {})  # Rolling JSON stats file of the updates and how many of them it keeps
+    frameServerConfig = config.get('frameServer')  # Optional HTTP server for the display, e.g. {"host": "0.0.0.0", "port": 8090}
 
     # Create and configure logger
     logging.basicConfig(filename="logfile.log", format='%(asctime)s %(levelname)s - %(message)s', filemode='a')
     logger = logging.getLogger('maginkdash')
     logger.addHandler(logging.StreamHandler(sys.stdout))  # print logger to stdout
     logger.setLevel(logging.INFO)
+
+    # A recording keeps every response of the run, a replay answers every request from one. Both send plain requests,
+    # whose responses don't depend on the local sync stores or on the random boundaries of batch requests.
+    archive = None
+    if args.record is not None or args.replay is not None:
+        from replay.archive import RunArchive, ArchiveError
+        calendarSync, taskSync, googleBatch = 'full', 'full', False
+        if args.record is not None:
+            archive = RunArchive(displayTZ=displayTZ.zone)
+        else:
+            try:
+                archive = RunArchive.load(args.replay)
+            except ArchiveError as e:
+                logger.error(str(e))
+                sys.exit(1)
+            displayTZ = timezone(archive.displayTZ)
+            # Everything a replay writes goes to the output folder, starting without the state of an earlier one
+            os.makedirs(args.output, exist_ok=True)
+            lastGoodConfig = {'file': os.path.join(args.output, 'lastgood.pickle')}
+            stateFile = os.path.join(args.output, 'state.json')
+            for profile in profiles:
+                profile['path_to_server_image'] = os.path.join(args.output, os.path.basename(profile['path_to_server_image']))
+            for path in [lastGoodConfig['file'], stateFile] + [profile['path_to_server_image'] + '.digest' for profile in profiles]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # Stage timings and counters of every module, served on /metrics by the frame server
+    # A replay keeps its stats next to its images, apart from the ones of the real updates
+    metrics = Metrics(statsFile=os.path.join(args.output, 'stats.json') if args.replay else metricsConfig.get('file'),
+                      history=metricsConfig.get('history', 288))
+    Metrics.set_instance(metrics)
     
-    logger.info("Copying css and fonts to the nginx server directory")
-    renderService = RenderHelper(imageWidth, imageHeight, nginx_server_dir=nginx_server_dir, nginx_serving_path=nginx_serving_path, 
-                                 browserless_url=browserless_url, browserless_token=browserless_token)
-    
-    logger.info("Starting dashboard update")
+    renderServices = []
+    renderExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=renderConcurrency, thread_name_prefix='render')
 
-    def job_run():
-        # Retrieve Weather Data
-        owmModule = OWMModule()
-        current_weather, hourly_forecast, daily_forecast = owmModule.get_weather(lat, lon, owm_api_key)
+    def get_render_services():
+        # Set up on the first render, a run without changes doesn't need the renderers or the assets
+        if renderServices:
+            return renderServices
+        from render.render import RenderHelper
+        from render.assets import AssetBuilder
+        for profile in profiles:
+            htmlName = 'dashboard.html' if profile['name'] is None else 'dashboard-{0}.html'.format(profile['name'])
+            renderServices.append(RenderHelper(profile['imageWidth'], profile['imageHeight'], nginx_server_dir=nginx_server_dir,
+                                               nginx_serving_path=nginx_serving_path, browserless_url=browserless_url,
+                                               browserless_token=browserless_token, renderer=profile['renderer'],
+                                               eink=profile['eink'], framePatch=profile['framePatch'],
+                                               template=profile['template'], htmlName=htmlName,
+                                               browserless_mode=browserless_mode, browserless_ws=browserless_ws,
+                                               frameHistory=profile['frameHistory']))
+        browserServices = [renderService for renderService in renderServices if renderService.renderer != 'native']
+        if browserServices:
+            # Only the css rules, font glyphs and background sizes the templates need, rewritten when they changed
+            logger.info("Building css, fonts and background in the nginx server directory")
+            assetBuilder = AssetBuilder(browserServices[0].currPath, nginx_server_dir)
+            assetBuilder.build([renderService.template.load().source for renderService in browserServices],
+                               [(renderService.imageWidth, renderService.imageHeight) for renderService in browserServices])
+        return renderServices
 
-        # Retrieve Calendar Data
-        currDate = dt.now(displayTZ).date()
+    # Created by the first source that needs them, from the fetch threads
+    shared = {}
+    sharedLocks = {'http': threading.Lock(), 'calendar': threading.Lock()}
+
+    def get_http_cache():
+        # One pooled session and on-disk response cache for the plain HTTP sources
+        with sharedLocks['http']:
+            if 'http' not in shared:
+                from httpcache.httpcache import HttpCache
+                if archive is None:
+                    shared['http'] = HttpCache(cacheFile=httpCacheConfig.get('file'), ttls=httpCacheConfig.get('ttl'))
+                else:
+                    # Every request of a recorded or replayed run goes out, none is answered from the cache file
+                    from replay.transport import RecordingAdapter, ReplayAdapter
+                    if args.record is not None:
+                        adapter = RecordingAdapter(archive, pool_connections=4, pool_maxsize=8)
+                    else:
+                        adapter = ReplayAdapter(archive)
+                    shared['http'] = HttpCache(ttls=httpCacheConfig.get('ttl'), adapter=adapter, persist=False)
+                HttpCache.set_instance(shared['http'])
+            return shared['http']
+
+    def get_calendar_module():
+        # The Google client behind it is created once and shared by the calendar and tasks sources
+        with sharedLocks['calendar']:
+            if 'calendar' not in shared:
+                from gcal.gcal import GcalModule
+                client = get_archive_client() if archive is not None else None
+                shared['calendar'] = GcalModule(eventSync=calendarSync, taskSync=taskSync, batch=googleBatch, client=client)
+            return shared['calendar']
+
+    def get_archive_client():
+        # Google client whose requests are recorded, or answered from the recording
+        from gcal.gclient import GoogleClient
+        from replay.transport import RecordingHttp, ReplayHttp
+        if args.record is not None:
+            return GoogleClient(transport=lambda http: RecordingHttp(http, archive))
+        # No credentials are needed, the requests never leave the process
+        from google.oauth2.credentials import Credentials
+        return GoogleClient(creds=Credentials(token='replay'), transport=lambda http: ReplayHttp(archive))
+
+    def get_now():
+        # A replay runs at the time of the recorded run, which the calendar window and the forecast depend on
+        if args.replay is not None:
+            return dt.fromisoformat(archive.recorded).astimezone(displayTZ)
+        return dt.now(displayTZ)
+
+    def get_weather():
+        from owm.owm import OWMModule, OWM_URL
+        owmModule = OWMModule(http=get_http_cache(), url=owm_url or OWM_URL)
+        return owmModule.get_weather(lat, lon, owm_api_key)
+
+    def get_calendar_window():
+        currDate = get_now().date()
         calStartDatetime = displayTZ.localize(dt.combine(currDate, dt.min.time()))
         calEndDatetime = displayTZ.localize(dt.combine(currDate + datetime.timedelta(days=numCalDaysToShow-1), dt.max.time()))
-        calModule = GcalModule()
-        eventList = calModule.get_events(
+        return currDate, calStartDatetime, calEndDatetime
+
+    # The events and tasks come with the date their first day is, so they can still be shown right on a later day
+    def get_events():
+        currDate, calStartDatetime, calEndDatetime = get_calendar_window()
+        return currDate, get_calendar_module().get_events(
             currDate, calendars, calStartDatetime, calEndDatetime, displayTZ, numCalDaysToShow)
-        
-        # Retrieve Timed Tasks
-        taskList = calModule.get_tasks(
+
+    def get_tasks():
+        currDate, calStartDatetime, calEndDatetime = get_calendar_window()
+        return currDate, get_calendar_module().get_tasks(
             currDate, tasklists, calStartDatetime, calEndDatetime, displayTZ, numCalDaysToShow)
-        
+
+    def get_note():
         if memos_config:
             # Retrieve Memos
-            memoModule = Memos()
-            currNote = memoModule.get_memo(memos['domain'], memos['accessToken'], memos['tag'])
+            from memos.memos import Memos
+            memoModule = Memos(http=get_http_cache())
+            note = memoModule.get_memo(memos['domain'], memos['accessToken'], memos['tag'])
         else:
             # Retrieve DumbDo
-            dd = Dumbdo()
-            currNote = dd.get_list(dumbdo['domain'], dumbdo['listName'])
+            from dumbdo.dumbdo import Dumbdo
+            dd = Dumbdo(http=get_http_cache())
+            note = dd.get_list(dumbdo['domain'], dumbdo['listName'])
+        if note is None:
+            # Counted as a failed source, so the last good note is shown instead of none at all
+            raise RuntimeError('No note could be retrieved')
+        return note
 
-        # Render Dashboard Image
-        renderService.process_inputs(currDate, current_weather, hourly_forecast, daily_forecast, eventList, taskList, numCalDaysToShow, currNote, path_to_server_image)
+    fetcher = Fetcher()
+    fetcher.add_source('weather', get_weather, deadlines['weather'])
+    fetcher.add_source('calendar', get_events, deadlines['calendar'])
+    fetcher.add_source('tasks', get_tasks, deadlines['tasks'])
+    fetcher.add_source('memo', get_note, deadlines['memo'])
+    # A source that comes in after its deadline wakes the loop up, so it doesn't wait for the next cadence to be shown
+    wakeup = threading.Event()
+    fetcher.onLate = wakeup.set
 
-        logger.info("Completed dashboard update")
-        
-    job_run()
-    
-    schedule.every().hour.do(job_run)
+    # Every source is fetched on its own cadence, and the dashboard is only rendered again when something changed
+    scheduler = RefreshScheduler(displayTZ, cadences=refreshConfig.get('cadence'), quietHours=refreshConfig.get('quietHours'),
+                                 eventLead=refreshConfig.get('eventLead'), stateFile=stateFile)
+    # Sources that fail are shown from their last good result, marked as stale, until they are back
+    lastGood = LastGoodStore(storeFile=lastGoodConfig.get('file'))
+    latest = {name: lastGood.get(name) for name in ('weather', 'calendar', 'tasks', 'memo') if name in lastGood}
+    # What the previous run (or process, with --once) left behind
+    savedState = scheduler.load_state()
+    failing = set(savedState.get('failing', []))
+    state = {'renderedDate': datetime.date.fromisoformat(savedState['renderedDate']) if savedState.get('renderedDate') else None,
+             'stale': [(name, dt.fromisoformat(fetched)) for name, fetched in savedState.get('stale', [])],
+             # A render failed, so the next run renders again even if nothing changed by then
+             'pendingRender': savedState.get('pendingRender', False)}
+
+    def save_state():
+        scheduler.save_state(renderedDate=state['renderedDate'].isoformat() if state['renderedDate'] else None,
+                             failing=sorted(failing),
+                             stale=[(name, fetched.isoformat()) for name, fetched in state['stale']],
+                             pendingRender=state['pendingRender'])
+
+    def get_next_refresh():
+        # Seconds until the frame is next expected to change, the device gets a minute more for the fetch and render
+        now = dt.now(displayTZ)
+        return max((scheduler.get_next_change(now) - now).total_seconds(), 0) + 60
+
+    # Frames are served from memory with ETags, so a device that already shows the current one only gets a 304
+    frameServer = None
+    if frameServerConfig is not None and not singleRun:
+        from server.frameserver import FrameServer
+        frameServer = FrameServer(host=frameServerConfig.get('host', '0.0.0.0'), port=frameServerConfig.get('port', 8090),
+                                  nextRefresh=get_next_refresh, metrics=metrics)
+        frameServer.start()
+
+    def publish_frames():
+        for profile, renderService in zip(profiles, get_render_services()):
+            # Tells a device which frame the patch applies to
+            frameDigest = renderService.get_frame_digest(profile['path_to_server_image'])
+            headers = {'X-Frame-Digest': frameDigest} if frameDigest is not None else None
+            for path in renderService.get_published_files(profile['path_to_server_image']):
+                frameServer.publish_file(path, headers=headers)
+
+    if frameServer is not None:
+        # The state file can make the first update find nothing changed, so the frames published before a restart are
+        # served until a new one is rendered
+        publish_frames()
+
+    def render_dashboard(currDate, sources, stale):
+        # Renders every profile from the given source results, returns the views of a recorded or replayed run and the
+        # names of the profiles that could not be rendered
+        current_weather, hourly_forecast, daily_forecast = sources['weather']
+        eventList = sources['calendar']
+        taskList = sources['tasks']
+        currNote = sources.get('memo')
+
+        # Render Dashboard Images, every profile shows the first days of the same data
+        views = {}
+        futures = []
+        for profile, renderService in zip(profiles, get_render_services()):
+            days = profile['numCalDaysToShow']
+            renderArgs = (currDate, current_weather, hourly_forecast, daily_forecast, eventList[:days], taskList[:days],
+                          days, currNote)
+            if archive is not None:
+                views[profile['name'] or 'dashboard'] = renderService.build_view(*renderArgs, stale)
+            futures.append(renderExecutor.submit(
+                renderService.process_inputs, *renderArgs, profile['path_to_server_image'], stale=stale))
+        from render.render import RenderError
+        failed = []
+        for profile, future in zip(profiles, futures):
+            try:
+                future.result()
+            except RenderError as e:
+                logger.error('Rendering of {0} failed: {1}'.format(profile['path_to_server_image'], e))
+                failed.append(profile['name'] or 'dashboard')
+            except Exception:
+                logger.exception('Rendering of {0} failed'.format(profile['path_to_server_image']))
+                failed.append(profile['name'] or 'dashboard')
+        return views, failed
+
+    def get_render_sources(currDate, now):
+        # The latest result of every source, moved to the current date where it was fetched on an earlier day
+        weather = align_weather(latest['weather'], now)
+        if weather is None:
+            return None
+        sources = {'weather': weather, 'memo': latest.get('memo')}
+        for name in ('calendar', 'tasks'):
+            fetchedDate, days = latest[name]
+            sources[name] = align_days(days, fetchedDate, currDate, numCalDaysToShow)
+        return sources
+
+    def update_dashboard():
+        now = get_now()
+        currDate = get_calendar_window()[0]
+
+        # Retrieve the sources that are due (Weather, Calendar, Timed Tasks and Memos/DumbDo) at the same time, or all
+        # of them for the first update of a recorded or replayed run
+        due = scheduler.get_due(now)
+        if archive is not None and not state.get('fetchedAll'):
+            due = list(fetcher.sources)
+            state['fetchedAll'] = True
+            archive.recorded = archive.recorded or now.isoformat()
+        results = fetcher.fetch(due)
+        if 'calendar' in results:
+            timedEvents = [event for day in results['calendar'][1] for event in day if not event['allday']]
+            scheduler.set_upcoming([event['startDatetime'] for event in timedEvents],
+                                   [event['endDatetime'] for event in timedEvents])
+        changed = []
+        for name in due:
+            scheduler.mark(name, now, success=name in results)
+            if name not in results:
+                failing.add(name)
+        # Results of sources that missed the deadline of an earlier fetch can come in without being due
+        for name, result in results.items():
+            failing.discard(name)
+            lastGood.put(name, result)
+            latest[name] = result
+            if scheduler.has_changed(name, result):
+                changed.append(name)
+
+        missing = [name for name in ('weather', 'calendar', 'tasks') if name not in latest]
+        if missing:
+            logger.error('Skipping dashboard update, no data from: ' + ', '.join(missing))
+            return
+        stale = [(name, dt.fromtimestamp(lastGood.get_time(name), displayTZ)) for name in ('weather', 'calendar', 'tasks', 'memo')
+                 if name in failing and name in lastGood]
+        if stale:
+            logger.info('Showing the last good data of: ' + ', '.join(name for name, fetched in stale))
+        if not changed and not state['pendingRender'] and state['renderedDate'] == currDate and stale == state['stale'] \
+                and archive is None:
+            logger.info('Fetched {0}, nothing changed'.format(', '.join(due) or 'nothing'))
+            return
+
+        sources = get_render_sources(currDate, now)
+        if sources is None:
+            logger.error('Skipping dashboard update, the last good forecast is too old')
+            return
+        views, failed = render_dashboard(currDate, sources, stale)
+        # What every profile was rendered from, kept in a recording and compared with it in a replay
+        if args.record is not None:
+            archive.views.update(views)
+        elif args.replay is not None:
+            state.setdefault('views', {}).update(views)
+        # Only what every profile published counts as shown, otherwise the next run renders again
+        state['pendingRender'] = bool(failed)
+        if not failed:
+            scheduler.commit_digests()
+            state['renderedDate'] = currDate
+            state['stale'] = stale
+
+        if frameServer is not None:
+            publish_frames()
+
+        if failed:
+            logger.error('Dashboard update incomplete, rendering again on the next run: ' + ', '.join(failed))
+            return
+        logger.info("Completed dashboard update ({0} changed)".format(', '.join(changed) or 'date or stale'))
+
+    def replay_run():
+        logger.info('Replaying the run recorded {0} ({1} responses{2})'.format(
+            archive.recorded, len(archive.exchanges),
+            ', failed then: ' + ', '.join(archive.failed) if archive.failed else ''))
+        job_run(replay=os.path.basename(args.replay))
+        changedViews = archive.get_changed_views(state.get('views', {}))
+        if changedViews:
+            logger.info('Views differ from the recorded ones for: ' + ', '.join(changedViews))
+        else:
+            logger.info('Views match the recorded ones')
+
+    def job_run(**details):
+        metrics.start_run()
+        try:
+            update_dashboard()
+        finally:
+            save_state()
+            metrics.end_run(**details)
+            if args.record is not None:
+                archive.failed = sorted(failing)
+                archive.save(args.record)
+
+    # Everything up to the first update, tracked in the stats file and on /metrics
+    startup = time.perf_counter() - startTime
+    metrics.observe('startup', startup)
+    logger.info('Started in {0:.2f}s'.format(startup))
+
+    if args.replay is not None:
+        replay_run()
+        logger.info('Finished in {0:.2f}s'.format(time.perf_counter() - startTime))
+        sys.exit(0)
+
+    if singleRun:
+        job_run(startup=round(startup, 3), once=True)
+        # Sources that missed their deadline are waited for rather than abandoned, and shown right away
+        if fetcher.wait_running():
+            job_run(once=True)
+        logger.info('Finished in {0:.2f}s'.format(time.perf_counter() - startTime))
+        sys.exit(0)
 
+    job_run(startup=round(startup, 3))
     while 1:
-        n = schedule.idle_seconds()
-        if n is None:
-            # no more jobs
-            break
-        elif n > 0:
-            # sleep exactly the right amount of time
-            time.sleep(n)
-        schedule.run_pending()
+        # sleep exactly until the next source is due, or until a late source comes in
+        wakeup.wait(timeout=scheduler.get_idle_seconds(dt.now(displayTZ)))
+        wakeup.clear()
+        job_run()
 
 
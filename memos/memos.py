@@ -5,41 +5,43 @@
 
 import logging
 import requests
+from httpcache.httpcache import HttpCache
+from httpcache.jsonstream import find_member
 
 class Memos:
-    def __init__(self):
+    def __init__(self, http=None):
         self.logger = logging.getLogger('maginkdash')
+        self.http = http if http is not None else HttpCache.get_instance()
 
     def get_memo(self, domain, accessToken, tag):
         self.logger.info('Retrieving Memos memo from the domain {0} and tag {1}'.format(domain, tag))
         
         try:
-            r = requests.get(domain + '/api/v1/memos',
-                             params={'filter': "tag_search == [\"" + tag + "\"]"},
-                             headers={'Accept': 'application/json',
-                                      'Authorization': 'Bearer ' + accessToken},
-                             timeout=10)
-            r.raise_for_status()
+            # Memos are listed newest first, only the first one is shown so only one is asked for
+            memos = self.http.get_json('memos', domain + '/api/v1/memos',
+                                       params={'filter': "tag_search == [\"" + tag + "\"]", 'pageSize': 1},
+                                       headers={'Accept': 'application/json',
+                                                'Authorization': 'Bearer ' + accessToken},
+                                       timeout=10,
+                                       parse=lambda r: find_member(r.iter_content(chunk_size=65536), 'memos', [])[:1])
         except requests.exceptions.HTTPError as errh:
-            self.logger.info("Http Error:",errh)
+            self.logger.info("Http Error: {0}".format(errh))
             return None
         except requests.exceptions.ConnectionError as errc:
-            self.logger.info("Error Connecting:",errc)
+            self.logger.info("Error Connecting: {0}".format(errc))
             return None
         except requests.exceptions.Timeout as errt:
-            self.logger.info("Timeout Error:",errt)
+            self.logger.info("Timeout Error: {0}".format(errt))
             return None
         except requests.exceptions.RequestException as err:
-            self.logger.info("OOps: Something Else",err)
+            self.logger.info("OOps: Something Else {0}".format(err))
             return None
             
-        json_response = r.json()
-        data = json_response
+        # None means the memo couldn't be retrieved, an empty string that there is nothing to show
+        if len(memos) == 0:
+            return ''
 
-        if len(data) == 0:
-            return None
-
-        text = data['memos'][0]['content']
+        text = memos[0]['content']
         text = text.replace("#" + tag, "")
         text = text.strip()
 
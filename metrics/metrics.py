@@ -0,0 +1,132 @@
+"""
+This is where the timings and counters of the dashboard are collected. Every stage of an update (each source fetch,
+event normalization, day bucketing, HTML generation, the screenshot, writing the frame) is timed, and counters keep
+track of cache hits, downloaded bytes, skipped renders and errors. The totals are available in the Prometheus text
+format (served by the frame server on /metrics), and every update is appended to a rolling JSON stats file that keeps
+the most recent ones.
+"""
+
+import contextlib
+import datetime
+import json
+import logging
+import os
+import os.path
+import pathlib
+import threading
+import time
+
+PREFIX = 'maginkdash_'
+
+
+class Metrics:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @classmethod
+    def set_instance(cls, instance):
+        with cls._instance_lock:
+            cls._instance = instance
+
+    def __init__(self, statsFile=None, history=288):
+        self.logger = logging.getLogger('maginkdash')
+        self.currPath = str(pathlib.Path(__file__).parent.absolute())
+        self.statsFile = statsFile if statsFile is not None else self.currPath + '/stats/stats.json'
+        self.history = history
+        self.lock = threading.Lock()
+        # stage: [count, sum, last, max] in seconds
+        self.stages = {}
+        # (name, sorted label items): value
+        self.counters = {}
+        self.currentRun = {}
+        self.runStart = None
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            stats = self.stages.setdefault(stage, [0, 0.0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = seconds
+            stats[3] = max(stats[3], seconds)
+            self.currentRun[stage] = self.currentRun.get(stage, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def start_run(self):
+        with self.lock:
+            self.currentRun = {}
+            self.runStart = time.time()
+
+    def end_run(self, **details):
+        # Append the stage timings of this update to the stats file, together with the counter totals
+        with self.lock:
+            record = {
+                'time': datetime.datetime.fromtimestamp(self.runStart or time.time()).isoformat(timespec='seconds'),
+                'duration': round(time.time() - (self.runStart or time.time()), 3),
+                'stages': {stage: round(seconds, 4) for stage, seconds in self.currentRun.items()},
+                'counters': {self.format_key(name, labels): value for (name, labels), value in self.counters.items()}
+            }
+            record.update(details)
+        self.write_stats(record)
+        return record
+
+    def write_stats(self, record):
+        records = []
+        if os.path.exists(self.statsFile):
+            try:
+                with open(self.statsFile, 'r') as file:
+                    records = json.load(file)
+            except ValueError:
+                self.logger.info('Stats file is corrupt, starting a new one')
+        records = (records + [record])[-self.history:]
+        os.makedirs(os.path.dirname(os.path.abspath(self.statsFile)), exist_ok=True)
+        with open(self.statsFile + '.tmp', 'w') as file:
+            json.dump(records, file, indent=1)
+        os.replace(self.statsFile + '.tmp', self.statsFile)
+
+    def format_key(self, name, labels):
+        if not labels:
+            return name
+        return '{0}{{{1}}}'.format(name, ','.join('{0}="{1}"'.format(key, str(value).replace('"', '\\"'))
+                                                 for key, value in labels))
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        with self.lock:
+            stages = sorted(self.stages.items())
+            counters = sorted(self.counters.items())
+        lines.append('# HELP {0}stage_seconds Time spent in every stage of the dashboard update'.format(PREFIX))
+        lines.append('# TYPE {0}stage_seconds summary'.format(PREFIX))
+        for stage, (count, total, last, longest) in stages:
+            lines.append('{0}stage_seconds_count{{stage="{1}"}} {2}'.format(PREFIX, stage, count))
+            lines.append('{0}stage_seconds_sum{{stage="{1}"}} {2:.6f}'.format(PREFIX, stage, total))
+        for name, index in (('stage_last_seconds', 2), ('stage_max_seconds', 3)):
+            lines.append('# TYPE {0}{1} gauge'.format(PREFIX, name))
+            for stage, stats in stages:
+                lines.append('{0}{1}{{stage="{2}"}} {3:.6f}'.format(PREFIX, name, stage, stats[index]))
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append('# TYPE {0}{1}_total counter'.format(PREFIX, name))
+                typed.add(name)
+            lines.append('{0}{1} {2}'.format(PREFIX, self.format_key(name + '_total', labels), value))
+        return '\n'.join(lines) + '\n'
@@ -4,21 +4,26 @@ signed up for an OWM account and also obtained a valid API key that is specified
 """
 
 import logging
-import requests
-import json
 import string
 import datetime
+from httpcache.httpcache import HttpCache
+
+OWM_URL = "https://api.openweathermap.org/data/3.0/onecall"
 
 
 class OWMModule:
-    def __init__(self):
+    def __init__(self, http=None, url=OWM_URL):
         self.logger = logging.getLogger('maginkdash')
+        self.http = http if http is not None else HttpCache.get_instance()
+        self.url = url
 
     def get_owm_weather(self, lat, lon, api_key):
-        url = "https://api.openweathermap.org/data/3.0/onecall?lat=%s&lon=%s&appid=%s&exclude=minutely,alerts&units=metric" % (
-        lat, lon, api_key)
-        response = requests.get(url)
-        data = json.loads(response.text)
+        url = self.url
+        params = {'lat': lat, 'lon': lon, 'appid': api_key, 'exclude': 'minutely,alerts', 'units': 'metric'}
+        data = self.http.get_json('owm', url, params=params, timeout=10)
+        if not all(key in data for key in ("current", "hourly", "daily")):
+            # e.g. {"cod": 401, "message": "Invalid API key..."}, the fetcher falls back to the last good forecast
+            raise ValueError('OpenWeatherMap returned no forecast: {0}'.format(data.get("message", data)))
         curr_weather = data["current"]
         hourly_forecast = data["hourly"]
         # print(json.dumps(curr_weather, indent=2))
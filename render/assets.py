@@ -0,0 +1,284 @@
+"""
+This is the asset build step for the browserless renderer. Instead of copying the whole css and font folders and the
+full size background to the nginx server directory, it builds only what the dashboard templates need:
+    - stylesheets are stripped down to the rules whose selectors can match an element of the templates
+    - fonts that no remaining rule uses are left out, and the weather icons font is subset to the icons the wi-owm-*
+      classes refer to when fontTools is installed. The text fonts keep all their glyphs, event titles and memos are
+      only known at run time and can use any letter the fonts have (e.g. ą, ł or ś).
+    - the background is scaled and cropped to every dashboard size and converted to grayscale
+A file is only written to the server directory when its content changed, and nothing is rebuilt at all while the
+sources, the templates and the sizes stay the same.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import os.path
+import pathlib
+import re
+from PIL import Image
+
+ALWAYS_USED_TAGS = {'html', 'body'}
+# Part of the build key, raised when the build itself changes so that assets built by an earlier version are replaced
+BUILD_VERSION = 3
+
+COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+# Comments starting with /*! are copyright and license notices, which are kept at the top of the purged stylesheet
+NOTICE_RE = re.compile(r'/\*!.*?\*/', re.S)
+PSEUDO_RE = re.compile(r'::?[\w-]+(\([^)]*\))?')
+ATTRIBUTE_RE = re.compile(r'\[[^\]]*\]')
+CLASS_RE = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+ID_RE = re.compile(r'#(-?[_a-zA-Z][\w-]*)')
+TAG_RE = re.compile(r'(?:^|[\s>+~])([a-zA-Z][\w-]*)')
+FONT_FAMILY_RE = re.compile(r'font-family\s*:([^;}]*)')
+ANIMATION_RE = re.compile(r'animation(?:-name)?\s*:([^;}]*)')
+CONTENT_RE = re.compile(r'content\s*:\s*"\\([0-9a-fA-F]+)"')
+URL_RE = re.compile(r'url\(\s*[\'"]?([^\'")?#]+)[^)]*\)')
+KEYFRAMES_RE = re.compile(r'@(-[a-z]+-)?keyframes')
+PLACEHOLDER_RE = re.compile(r'\{[#^/]?[A-Za-z_][A-Za-z0-9_]*\}')
+
+
+class AssetBuilder:
+
+    def __init__(self, src_dir, dest_dir):
+        self.logger = logging.getLogger('maginkdash')
+        self.srcDir = src_dir
+        self.destDir = dest_dir
+        self.manifestFile = os.path.join(dest_dir, '.assets.json')
+
+    @staticmethod
+    def get_background_name(width, height):
+        return 'background-{0}x{1}.jpg'.format(width, height)
+
+    @staticmethod
+    def cover(image, width, height):
+        # Same as background-size: cover, scaled to fill the page and cropped around the center
+        ratio = max(width / image.width, height / image.height)
+        size = (max(round(image.width * ratio), width), max(round(image.height * ratio), height))
+        image = image.resize(size, Image.LANCZOS)
+        left = (image.width - width) // 2
+        top = (image.height - height) // 2
+        return image.crop((left, top, left + width, top + height))
+
+    def get_used_names(self, templates):
+        # Tags, classes and ids of all templates. Classes built from a template field (e.g. wi-owm-{id}) become a
+        # pattern, so that every rule they could resolve to is kept.
+        tags, classes, ids, patterns = set(ALWAYS_USED_TAGS), set(), set(), []
+        for source in templates:
+            tags.update(tag.lower() for tag in re.findall(r'<([a-zA-Z][\w-]*)', source))
+            ids.update(re.findall(r'\bid="([^"]*)"', source))
+            for attribute in re.findall(r'\bclass="([^"]*)"', source):
+                for name in attribute.split():
+                    if PLACEHOLDER_RE.search(name):
+                        parts = PLACEHOLDER_RE.split(name)
+                        patterns.append(re.compile(r'\w+'.join(re.escape(part) for part in parts) + '$'))
+                    else:
+                        classes.add(name)
+        return tags, classes, ids, patterns
+
+    def selector_used(self, selector, used):
+        tags, classes, ids, patterns = used
+        selector = ATTRIBUTE_RE.sub('', PSEUDO_RE.sub('', selector)).strip()
+        for name in CLASS_RE.findall(selector):
+            if name not in classes and not any(pattern.match(name) for pattern in patterns):
+                return False
+        for name in ID_RE.findall(selector):
+            if name not in ids:
+                return False
+        withoutNames = CLASS_RE.sub('', ID_RE.sub('', selector))
+        return all(tag.lower() in tags for tag in TAG_RE.findall(withoutNames))
+
+    def parse_rules(self, css, start=0):
+        # Splits a stylesheet into (prelude, body) pairs, with body a list of rules again for nested at-rules
+        rules = []
+        pos = start
+        while pos < len(css):
+            openPos = css.find('{', pos)
+            closePos = css.find('}', pos)
+            if closePos != -1 and (openPos == -1 or closePos < openPos):
+                return rules, closePos + 1
+            if openPos == -1:
+                break
+            prelude = css[pos:openPos].strip()
+            # At-rules without a block (e.g. @charset) end up at the start of the next prelude
+            while prelude.startswith('@') and ';' in prelude:
+                prelude = prelude.split(';', 1)[1].strip()
+            nextClose = css.find('}', openPos)
+            if prelude.startswith('@') and '{' in css[openPos + 1:nextClose]:
+                body, pos = self.parse_rules(css, openPos + 1)
+            else:
+                body, pos = css[openPos + 1:nextClose], nextClose + 1
+            rules.append((prelude, body))
+        return rules, len(css)
+
+    def purge_rules(self, rules, used):
+        kept = []
+        for prelude, body in rules:
+            if KEYFRAMES_RE.match(prelude):
+                kept.append((prelude, body))
+            elif isinstance(body, list):
+                body = self.purge_rules(body, used)
+                if body:
+                    kept.append((prelude, body))
+            elif prelude.startswith('@'):
+                kept.append((prelude, body))
+            else:
+                selectors = [selector.strip() for selector in prelude.split(',') if self.selector_used(selector, used)]
+                if selectors:
+                    kept.append((','.join(selectors), body))
+        return kept
+
+    def flatten(self, rules):
+        for prelude, body in rules:
+            if isinstance(body, list):
+                yield from self.flatten(body)
+            else:
+                yield prelude, body
+
+    def filter_at_rules(self, rules, families, animations):
+        # Drop font faces and keyframes that none of the remaining rules refer to
+        kept = []
+        for prelude, body in rules:
+            if prelude.startswith('@font-face'):
+                match = FONT_FAMILY_RE.search(body)
+                if match is None or match.group(1).strip().strip('\'"') not in families:
+                    continue
+            elif KEYFRAMES_RE.match(prelude) and prelude.split()[-1] not in animations:
+                continue
+            elif isinstance(body, list):
+                body = self.filter_at_rules(body, families, animations)
+            kept.append((prelude, body))
+        return kept
+
+    def serialize(self, rules):
+        return ''.join('{0}{{{1}}}'.format(prelude, self.serialize(body) if isinstance(body, list) else body.strip())
+                       for prelude, body in rules)
+
+    def purge_stylesheets(self, used, notices):
+        # Returns {name: rules} with the rules of every stylesheet that can apply to the templates, and adds the
+        # license notices of every stylesheet to notices as {name: notices}
+        stylesheets = {}
+        for path in sorted(pathlib.Path(self.srcDir, 'css').glob('*.css')):
+            css = path.read_text()
+            notices[path.name] = ''.join(NOTICE_RE.findall(css))
+            rules = self.purge_rules(self.parse_rules(COMMENT_RE.sub('', css))[0], used)
+            stylesheets[path.name] = rules
+
+        declarations = [body for sheet in stylesheets.values() for prelude, body in self.flatten(sheet)
+                        if not prelude.startswith('@')]
+        families, animations = set(), set()
+        for body in declarations:
+            for match in FONT_FAMILY_RE.findall(body):
+                families.update(family.strip().strip('\'"') for family in match.split(','))
+            for match in ANIMATION_RE.findall(body):
+                animations.update(match.replace(',', ' ').split())
+        return {name: self.filter_at_rules(rules, families, animations) for name, rules in stylesheets.items()}
+
+    def build_fonts(self, stylesheets, outputs):
+        # Every font face is reduced to its TrueType source, which all current browsers load, and the icons font is
+        # subset if possible
+        try:
+            from fontTools import subset
+        except ImportError:
+            subset = None
+            self.logger.info('fontTools is not installed, fonts are copied without subsetting')
+
+        icons = set()
+        for sheet in stylesheets.values():
+            for prelude, body in self.flatten(sheet):
+                icons.update(int(codepoint, 16) for codepoint in CONTENT_RE.findall(body))
+
+        for name, sheet in stylesheets.items():
+            for i, (prelude, body) in enumerate(sheet):
+                if not prelude.startswith('@font-face'):
+                    continue
+                fonts = [url for url in URL_RE.findall(body) if url.endswith('.ttf')]
+                if not fonts:
+                    continue
+                fontName = os.path.basename(fonts[0])
+                data = pathlib.Path(self.srcDir, 'font', fontName).read_bytes()
+                if subset is not None and 'weathericons' in fontName:
+                    # The weather icons font only has private use glyphs, only the ones the stylesheets use are kept
+                    options = subset.Options()
+                    options.layout_features = ['*']
+                    options.name_IDs = ['*']
+                    # Tables of the font tools the fonts were made with, fontTools would drop them with a warning
+                    options.drop_tables += ['FFTM', 'webf']
+                    font = subset.load_font(io.BytesIO(data), options)
+                    subsetter = subset.Subsetter(options)
+                    subsetter.populate(unicodes=icons)
+                    subsetter.subset(font)
+                    out = io.BytesIO()
+                    subset.save_font(font, out, options)
+                    data = out.getvalue()
+                outputs['font/' + fontName] = data
+                src = "src:url('../font/{0}') format('truetype')".format(fontName)
+                body = re.sub(r'src\s*:[^;}]*url[^;}]*;?', '', body)
+                sheet[i] = (prelude, src + ';' + body.strip())
+
+    def build_background(self, width, height):
+        with Image.open(os.path.join(self.srcDir, 'background.jpg')) as background:
+            background = background.convert('L')
+        out = io.BytesIO()
+        self.cover(background, width, height).save(out, 'JPEG', quality=90, optimize=True)
+        return out.getvalue()
+
+    def get_build_key(self, templates, sizes):
+        digest = hashlib.sha256()
+        digest.update(str(BUILD_VERSION).encode('utf-8'))
+        for path in sorted(pathlib.Path(self.srcDir).glob('css/*.css')) + sorted(pathlib.Path(self.srcDir).glob('font/*')) + \
+                [pathlib.Path(self.srcDir, 'background.jpg')]:
+            digest.update(path.name.encode('utf-8'))
+            digest.update(path.read_bytes())
+        for source in sorted(templates):
+            digest.update(source.encode('utf-8'))
+        digest.update(json.dumps(sorted(sizes)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def load_manifest(self):
+        if os.path.exists(self.manifestFile):
+            with open(self.manifestFile, 'r') as file:
+                return json.load(file)
+        return {'key': None, 'files': {}}
+
+    def build(self, templates, sizes):
+        # templates is a list of template sources, sizes a list of (width, height) for the backgrounds
+        sizes = sorted(set(tuple(size) for size in sizes))
+        key = self.get_build_key(templates, sizes)
+        manifest = self.load_manifest()
+        if manifest['key'] == key and all(os.path.exists(os.path.join(self.destDir, name)) for name in manifest['files']):
+            self.logger.info('Dashboard assets are up to date')
+            return False
+
+        used = self.get_used_names(templates)
+        notices = {}
+        stylesheets = self.purge_stylesheets(used, notices)
+        outputs = {}
+        self.build_fonts(stylesheets, outputs)
+        for name, rules in stylesheets.items():
+            outputs['css/' + name] = (notices[name] + self.serialize(rules)).encode('utf-8')
+        for width, height in sizes:
+            outputs[self.get_background_name(width, height)] = self.build_background(width, height)
+
+        # Only the files whose content changed are written
+        files = {}
+        written = 0
+        for name, data in outputs.items():
+            files[name] = hashlib.sha256(data).hexdigest()
+            path = os.path.join(self.destDir, name)
+            if manifest['files'].get(name) == files[name] and os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'wb') as file:
+                file.write(data)
+            os.replace(path + '.tmp', path)
+            written += 1
+
+        with open(self.manifestFile + '.tmp', 'w') as file:
+            json.dump({'key': key, 'files': files}, file, indent=1)
+        os.replace(self.manifestFile + '.tmp', self.manifestFile)
+        self.logger.info('Dashboard assets built, {0} of {1} files changed ({2} bytes in total)'.format(
+            written, len(outputs), sum(len(data) for data in outputs.values())))
+        return True
@@ -0,0 +1,140 @@
+"""
+This keeps a single dashboard page open in browserless over a DevTools (CDP) WebSocket connection. The page is loaded
+from nginx once, together with its stylesheets, fonts and background, and every new dashboard is pushed into it by
+swapping the body in place. The screenshot is taken as soon as fonts are ready and layout has settled, instead of
+opening a fresh page and waiting a fixed timeout for every frame.
+
+If the connection drops (browserless closes idle sessions) it is opened again on the next render.
+"""
+
+import base64
+import json
+import logging
+import threading
+import time
+import websocket
+
+# Replaces the body with the one of the new document, then waits for fonts and two animation frames so that layout
+# and paint have caught up before the screenshot
+UPDATE_SCRIPT = """
+(async (html) => {
+    const doc = new DOMParser().parseFromString(html, 'text/html');
+    document.body.replaceWith(document.adoptNode(doc.body));
+    await document.fonts.ready;
+    await new Promise(resolve => requestAnimationFrame(() => requestAnimationFrame(resolve)));
+    return true;
+})(%s)
+"""
+
+
+class BrowserSessionError(Exception):
+    pass
+
+
+class BrowserSession:
+
+    def __init__(self, ws_endpoint, page_url, width, height, timeout=30):
+        self.logger = logging.getLogger('maginkdash')
+        self.wsEndpoint = ws_endpoint
+        self.pageUrl = page_url
+        self.imageWidth = width
+        self.imageHeight = height
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.ws = None
+        self.sessionId = None
+        self.pageVersion = None
+        self.messageId = 0
+        self.events = []
+
+    @staticmethod
+    def get_ws_endpoint(browserless_url, browserless_token):
+        # http://host:3000 -> ws://host:3000?token=...
+        endpoint = browserless_url.replace('https://', 'wss://', 1).replace('http://', 'ws://', 1)
+        if browserless_token:
+            endpoint += '?token=' + browserless_token
+        return endpoint
+
+    def send(self, method, params=None, sessionId=None):
+        self.messageId += 1
+        message = {'id': self.messageId, 'method': method, 'params': params or {}}
+        if sessionId is not None:
+            message['sessionId'] = sessionId
+        self.ws.send(json.dumps(message))
+
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            response = json.loads(self.ws.recv())
+            if response.get('id') == self.messageId:
+                if 'error' in response:
+                    raise BrowserSessionError('{0} failed: {1}'.format(method, response['error'].get('message')))
+                return response.get('result', {})
+            if 'method' in response:
+                self.events.append(response['method'])
+        raise BrowserSessionError('{0} timed out'.format(method))
+
+    def wait_for_event(self, method):
+        deadline = time.monotonic() + self.timeout
+        while method not in self.events:
+            if time.monotonic() > deadline:
+                raise BrowserSessionError('Timed out waiting for ' + method)
+            response = json.loads(self.ws.recv())
+            if 'method' in response:
+                self.events.append(response['method'])
+        self.events = []
+
+    def connect(self):
+        self.close()
+        self.logger.info('Opening browser session for ' + self.pageUrl)
+        self.ws = websocket.create_connection(self.wsEndpoint, timeout=self.timeout)
+        targetId = self.send('Target.createTarget', {'url': 'about:blank'})['targetId']
+        self.sessionId = self.send('Target.attachToTarget', {'targetId': targetId, 'flatten': True})['sessionId']
+        self.send('Emulation.setDeviceMetricsOverride', {'width': self.imageWidth, 'height': self.imageHeight,
+                                                         'deviceScaleFactor': 1, 'mobile': False}, self.sessionId)
+        self.send('Page.enable', sessionId=self.sessionId)
+
+    def load_page(self, version):
+        # Full navigation, only needed for a new session or after the template (and so the head) changed
+        self.events = []
+        self.send('Page.navigate', {'url': self.pageUrl}, self.sessionId)
+        self.wait_for_event('Page.loadEventFired')
+        self.pageVersion = version
+
+    def update(self, html, path_to_server_image):
+        result = self.send('Runtime.evaluate', {'expression': UPDATE_SCRIPT % json.dumps(html), 'awaitPromise': True,
+                                                'returnByValue': True}, self.sessionId)
+        if 'exceptionDetails' in result:
+            raise BrowserSessionError('Updating the page failed: {0}'.format(result['exceptionDetails'].get('text')))
+        result = self.send('Page.captureScreenshot', {
+            'format': 'png',
+            'clip': {'x': 0, 'y': 0, 'width': self.imageWidth, 'height': self.imageHeight, 'scale': 1}
+        }, self.sessionId)
+        with open(path_to_server_image, 'wb') as f:
+            f.write(base64.b64decode(result['data']))
+
+    def render(self, html, version, path_to_server_image):
+        # version identifies the page layout, the page is navigated again whenever it changes
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.ws is None:
+                        self.connect()
+                    if self.pageVersion != version:
+                        self.load_page(version)
+                    self.update(html, path_to_server_image)
+                    self.logger.info('Screenshot captured from browser session and saved to file.')
+                    return True
+                except (websocket.WebSocketException, OSError, BrowserSessionError) as e:
+                    self.logger.info('Browser session failed ({0}), reconnecting'.format(e))
+                    self.close()
+            return False
+
+    def close(self):
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except (websocket.WebSocketException, OSError):
+                pass
+        self.ws = None
+        self.sessionId = None
+        self.pageVersion = None
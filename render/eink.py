@@ -0,0 +1,102 @@
+"""
+This is the post-processing of a rendered frame for the e-ink panel. The Inkplate 10 shows 8 levels of gray in its
+3-bit mode, so the frame is reduced to those levels here once, instead of on the device after every download. Two
+files come out of it: a palettized PNG that is a fraction of the size of the full-color screenshot, and a packed raw
+frame (two pixels per byte, or 3 bits per pixel) that the sketch can stream straight into the display buffer.
+"""
+
+import logging
+import os
+import os.path
+import numpy as np
+from PIL import Image
+
+# 8x8 Bayer matrix, used as a threshold map for ordered dithering
+BAYER_8X8 = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21]
+], dtype=np.float32)
+
+
+class EinkConverter:
+
+    def __init__(self, levels=8, dither='bayer', bpp=4):
+        self.logger = logging.getLogger('maginkdash')
+        # 0 is black and levels - 1 is white, same as the colors of the Inkplate 3-bit mode
+        self.levels = levels
+        # 'none', 'bayer' (ordered, fully vectorized) or 'floyd-steinberg' (error diffusion)
+        self.dither = dither
+        self.bpp = bpp
+
+    def quantize(self, image):
+        # Returns a uint8 array of gray levels with the same size as the image
+        gray = image.convert('L')
+        maxLevel = self.levels - 1
+
+        if self.dither == 'floyd-steinberg':
+            # Error diffusion is sequential by nature, so leave it to Pillow's C implementation
+            palette = []
+            for level in range(self.levels):
+                value = round(level * 255 / maxLevel)
+                palette += [value, value, value]
+            paletteImage = Image.new('P', (1, 1))
+            paletteImage.putpalette(palette + palette[-3:] * (256 - self.levels))
+            quantized = gray.convert('RGB').quantize(palette=paletteImage, dither=Image.Dither.FLOYDSTEINBERG)
+            return np.minimum(np.asarray(quantized, dtype=np.uint8), maxLevel)
+
+        scaled = np.asarray(gray, dtype=np.float32) * (maxLevel / 255)
+        if self.dither == 'bayer':
+            height, width = scaled.shape
+            threshold = (BAYER_8X8 + 0.5) / 64
+            tiled = np.tile(threshold, (height // 8 + 1, width // 8 + 1))[:height, :width]
+            levels = np.floor(scaled + tiled)
+        else:
+            levels = np.rint(scaled)
+        return np.clip(levels, 0, maxLevel).astype(np.uint8)
+
+    def to_image(self, levels):
+        # Palettized image with just the panel's gray levels, Pillow writes it with a 4-bit depth
+        maxLevel = self.levels - 1
+        image = Image.fromarray(levels, mode='P')
+        palette = []
+        for level in range(self.levels):
+            value = round(level * 255 / maxLevel)
+            palette += [value, value, value]
+        image.putpalette(palette)
+        return image
+
+    def pack(self, levels):
+        # Rows are padded to whole bytes so the device can read the frame row by row
+        height, width = levels.shape
+        if self.bpp == 4:
+            if width % 2:
+                levels = np.pad(levels, ((0, 0), (0, 1)))
+            return ((levels[:, 0::2] << 4) | levels[:, 1::2]).astype(np.uint8).tobytes()
+
+        # 3 bits per pixel, most significant bit first
+        bits = np.unpackbits(levels[:, :, np.newaxis], axis=2)[:, :, 5:].reshape(height, width * 3)
+        return np.packbits(bits, axis=1).tobytes()
+
+    def get_raw_path(self, path_to_server_image):
+        return os.path.splitext(path_to_server_image)[0] + '.raw'
+
+    def process(self, staging_path, path_to_server_image):
+        # Replace the rendered PNG in staging with its e-ink version and publish the raw frame of the image
+        with Image.open(staging_path) as image:
+            levels = self.quantize(image)
+        self.to_image(levels).save(staging_path, 'PNG', optimize=True)
+
+        rawPath = self.get_raw_path(path_to_server_image)
+        with open(rawPath + '.tmp', 'wb') as file:
+            file.write(self.pack(levels))
+        os.replace(rawPath + '.tmp', rawPath)
+
+        self.logger.info('Frame converted to {0} gray levels ({1} dithering), {2} and {3} bytes'.format(
+            self.levels, self.dither, os.path.getsize(staging_path), os.path.getsize(rawPath)))
+        return levels
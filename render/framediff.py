@@ -0,0 +1,129 @@
+"""
+This is where consecutive frames are compared. The previously published frame is kept next to the image, and every new
+frame is diffed against it on a grid of small tiles. Changed tiles are merged into a short list of dirty rectangles
+that is published as a patch file, so a client only needs the pixels of the regions that actually changed.
+
+Patch format (little endian):
+    header: b'MDP2', width (u16), height (u16), bits per pixel (u8, 4 or 8), rectangle count (u16),
+            base digest (16 bytes), frame digest (16 bytes)
+    for every rectangle: x, y, w, h (u16 each), followed by its pixels row by row, rows padded to whole bytes
+
+A patch only turns the frame it was diffed against (the base) into the new frame. The digests identify the pixels of
+both, and the frame server sends the digest of the current frame as X-Frame-Digest with every file of the dashboard.
+A device keeps the digest of the frame it shows (from that header or from the last patch it applied) and only applies
+a patch whose base digest matches it, otherwise (e.g. after sleeping through an update) it downloads the full frame.
+A base digest of zeros marks a patch that covers the whole frame, which applies on top of anything.
+"""
+
+import hashlib
+import logging
+import os
+import os.path
+import struct
+import numpy as np
+
+PATCH_MAGIC = b'MDP2'
+PATCH_HEADER = struct.Struct('<4sHHBH16s16s')
+DIGEST_SIZE = 16
+
+
+class FrameDiff:
+
+    def __init__(self, tile=8):
+        self.logger = logging.getLogger('maginkdash')
+        self.tile = tile
+
+    def get_paths(self, path_to_server_image):
+        base = os.path.splitext(path_to_server_image)[0]
+        return base + '.frame.npy', base + '.patch'
+
+    def get_digest(self, frame):
+        height, width = frame.shape
+        digest = hashlib.sha256(struct.pack('<HH', width, height))
+        digest.update(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+        return digest.digest()[:DIGEST_SIZE]
+
+    def read_frame_digest(self, path_to_server_image):
+        # Hex digest of the frame the published patch leads to, None without a patch
+        patchPath = self.get_paths(path_to_server_image)[1]
+        if not os.path.exists(patchPath):
+            return None
+        with open(patchPath, 'rb') as file:
+            header = file.read(PATCH_HEADER.size)
+        if len(header) < PATCH_HEADER.size or header[:4] != PATCH_MAGIC:
+            return None
+        return PATCH_HEADER.unpack(header)[6].hex()
+
+    def get_dirty_rects(self, previous, current):
+        # Returns a list of (x, y, w, h) covering every changed pixel
+        if previous is None or previous.shape != current.shape:
+            return [(0, 0, current.shape[1], current.shape[0])]
+
+        height, width = current.shape
+        tile = self.tile
+        rows = -(-height // tile)
+        cols = -(-width // tile)
+        changed = np.zeros((rows * tile, cols * tile), dtype=bool)
+        changed[:height, :width] = previous != current
+        tiles = changed.reshape(rows, tile, cols, tile).any(axis=(1, 3))
+
+        # Runs of changed tiles in every tile row, found with a vectorized edge detection
+        edges = np.diff(np.pad(tiles.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+        runRows, runStarts = np.nonzero(edges == 1)
+        runEnds = np.nonzero(edges == -1)[1]
+
+        # Runs spanning the same columns in consecutive rows are merged into one rectangle
+        rects = []
+        openRects = {}
+        for row, start, end in zip(runRows.tolist(), runStarts.tolist(), runEnds.tolist()):
+            rect = openRects.get((start, end))
+            if rect is not None and rect[3] == row:
+                rect[3] = row + 1
+            else:
+                rect = [start, row, end, row + 1]
+                rects.append(rect)
+                openRects[(start, end)] = rect
+
+        return [(x0 * tile, y0 * tile, min(x1 * tile, width) - x0 * tile, min(y1 * tile, height) - y0 * tile)
+                for x0, y0, x1, y1 in rects]
+
+    def pack_pixels(self, pixels, bpp):
+        if bpp == 8:
+            return pixels.astype(np.uint8).tobytes()
+        if pixels.shape[1] % 2:
+            pixels = np.pad(pixels, ((0, 0), (0, 1)))
+        return ((pixels[:, 0::2] << 4) | pixels[:, 1::2]).astype(np.uint8).tobytes()
+
+    def build_patch(self, current, rects, baseDigest):
+        height, width = current.shape
+        # Gray levels of the e-ink panel fit in a nibble, plain grayscale frames need a whole byte
+        bpp = 4 if current.max(initial=0) < 16 else 8
+        parts = [PATCH_HEADER.pack(PATCH_MAGIC, width, height, bpp, len(rects), baseDigest, self.get_digest(current))]
+        for x, y, w, h in rects:
+            parts.append(struct.pack('<HHHH', x, y, w, h))
+            parts.append(self.pack_pixels(current[y:y + h, x:x + w], bpp))
+        return b''.join(parts)
+
+    def update(self, path_to_server_image, current):
+        # Diff the new frame against the previous one, publish the patch and keep the new frame for next time
+        framePath, patchPath = self.get_paths(path_to_server_image)
+        previous = np.load(framePath) if os.path.exists(framePath) else None
+
+        rects = self.get_dirty_rects(previous, current)
+        if previous is None or previous.shape != current.shape:
+            baseDigest = bytes(DIGEST_SIZE)
+        else:
+            baseDigest = self.get_digest(previous)
+        patch = self.build_patch(current, rects, baseDigest)
+        with open(patchPath + '.tmp', 'wb') as file:
+            file.write(patch)
+        os.replace(patchPath + '.tmp', patchPath)
+
+        with open(framePath + '.tmp', 'wb') as file:
+            np.save(file, current)
+        os.replace(framePath + '.tmp', framePath)
+
+        area = sum(w * h for _, _, w, h in rects)
+        self.logger.info('Frame diff: {0} dirty rectangles covering {1:.1f}% of the frame, patch is {2} bytes'.format(
+            len(rects), 100 * area / current.size, len(patch)))
+        return rects
@@ -0,0 +1,182 @@
+"""
+This is the browserless-free way of rendering the dashboard. It draws the same layout as dashboard_template.html (date
+block, weather for the next hour and the coming days, the event lists and the memo) straight into an image with Pillow,
+using the bundled fonts and the weather icon glyphs, so no web server or headless Chrome is needed.
+
+The coordinates below follow what the HTML template renders to at 1200x825 with the bundled Bootstrap 3 stylesheet
+(1rem = 10px) and are scaled for other resolutions.
+"""
+
+import logging
+import pathlib
+import re
+from PIL import Image, ImageDraw, ImageFont
+from render.assets import AssetBuilder
+
+BASE_WIDTH = 1200
+BASE_HEIGHT = 825
+BLACK = (0, 0, 0)
+GRAY = (128, 128, 128)
+
+
+class NativeRenderer:
+
+    def __init__(self, width, height):
+        self.logger = logging.getLogger('maginkdash')
+        self.currPath = str(pathlib.Path(__file__).parent.absolute())
+        self.imageWidth = width
+        self.imageHeight = height
+        self.scaleX = width / BASE_WIDTH
+        self.scale = height / BASE_HEIGHT
+        self.fonts = {}
+        self.weatherGlyphs = self._load_weather_glyphs()
+        self.background = self._load_background()
+
+    def _load_weather_glyphs(self):
+        # Map OWM condition codes to the glyphs of the weather icons font, same as the wi-owm-* classes do
+        with open(self.currPath + '/css/weather-icons.min.css', 'r') as file:
+            css = file.read()
+        return {int(code): chr(int(codepoint, 16))
+                for code, codepoint in re.findall(r'\.wi-owm-(\d+):before\{content:"\\(f[0-9a-f]+)"\}', css)}
+
+    def _load_background(self):
+        # Scaled and cropped the same way as the background of the browserless dashboard
+        with Image.open(self.currPath + '/background.jpg') as background:
+            background = background.convert('RGB')
+        return AssetBuilder.cover(background, self.imageWidth, self.imageHeight)
+
+    def get_font(self, name, size):
+        size = max(round(size * self.scale), 1)
+        key = (name, size)
+        if key not in self.fonts:
+            self.fonts[key] = ImageFont.truetype(self.currPath + '/font/' + name, size)
+        return self.fonts[key]
+
+    def x(self, value):
+        return round(value * self.scaleX)
+
+    def y(self, value):
+        return round(value * self.scale)
+
+    def fit_text(self, draw, text, font, maxWidth):
+        # Same as text-overflow: ellipsis on a single line
+        if draw.textlength(text, font=font) <= maxWidth:
+            return text
+        while text and draw.textlength(text + '\u2026', font=font) > maxWidth:
+            text = text[:-1]
+        return text + '\u2026'
+
+    def draw_centered(self, draw, text, font, centerX, top, fill=BLACK):
+        draw.text((centerX, top), text, font=font, fill=fill, anchor='ma')
+
+    def draw_icon(self, draw, code, font, centerX, centerY, fill=BLACK):
+        # Icons are centered on their box, the glyphs of the weather icons font sit well below the ascender
+        draw.text((centerX, centerY), self.weatherGlyphs.get(code, ''), font=font, fill=fill, anchor='mm')
+
+    def draw_weather(self, draw, view):
+        regular = 'Lexend-Regular.ttf'
+        icons = 'weathericons-regular-webfont.ttf'
+        leftCenter = self.x(315)
+
+        # Big day of the month, with weekday and month next to it
+        draw.text((self.x(300), self.y(20)), view['day'], font=self.get_font('TiltWarp-Regular.ttf', 180), fill=BLACK, anchor='ra')
+        dateFont = self.get_font(regular, 25)
+        draw.text((self.x(315), self.y(135)), view['weekday'], font=dateFont, fill=BLACK)
+        draw.text((self.x(315), self.y(171)), view['month'], font=dateFont, fill=BLACK)
+
+        # Weather for the next hour
+        self.draw_icon(draw, view['current_weather_id'], self.get_font(icons, 250), leftCenter, self.y(400))
+        self.draw_centered(draw, '{0} | {1}\u00b0'.format(view['current_weather_text'], view['current_weather_temp']),
+                           self.get_font(regular, 30), leftCenter, self.y(567))
+
+        # Forecast for the days shown, in as many columns as there are days with a forecast
+        forecastDays = [day for day in view['days'] if 'weather' in day]
+        if not forecastDays:
+            return
+        columnWidth = self.x(570) / len(forecastDays)
+        # Smaller icons and text once the columns get narrower than the three column layout
+        shrink = min(1, 3 / len(forecastDays))
+        for i, day in enumerate(forecastDays):
+            centerX = self.x(30) + round(columnWidth * (i + 0.5))
+            name = 'Today' if i == 0 else day['name']
+            weather = day['weather']
+            self.draw_icon(draw, weather['id'], self.get_font(icons, 100 * shrink), centerX, self.y(690), fill=GRAY)
+            textFont = self.get_font(regular, 24 * shrink)
+            self.draw_centered(draw, name, textFont, centerX, self.y(750))
+            self.draw_centered(draw, '{0}% | {1}-{2}\u00b0'.format(weather['pop'], weather['min'], weather['max']),
+                               textFont, centerX, self.y(750 + 29 * shrink))
+
+    def draw_events(self, draw, view):
+        regular = 'Lexend-Regular.ttf'
+        headingFont = self.get_font(regular, 30)
+        eventFont = self.get_font(regular, 25)
+        memoFont = self.get_font('Lexend-Light.ttf', 25)
+        left = self.x(615)
+        maxWidth = round((self.x(1170) - left) * 0.95)
+        lineHeight = self.y(36)
+        bottom = self.imageHeight
+
+        def draw_line(top, parts):
+            # parts is a list of (text, colour), drawn one after the other and cut off at the column edge
+            bullet = '\u2022 '
+            draw.text((left, top), bullet, font=eventFont, fill=BLACK)
+            x = left + draw.textlength(bullet, font=eventFont)
+            for text, fill in parts:
+                text = self.fit_text(draw, text, eventFont, left + maxWidth - x)
+                draw.text((x, top), text, font=eventFont, fill=fill)
+                x += draw.textlength(text, font=eventFont)
+
+        y = self.y(50)
+        for i, day in enumerate(view['days']):
+            # A heading is only worth drawing if at least one line fits below it
+            if y + self.y(63) + lineHeight > bottom:
+                return
+            y += self.y(20)
+            draw.text((left, y), 'Today' if i == 0 else day['name'], font=headingFont, fill=BLACK)
+            y += self.y(43)
+
+            lines = []
+            if day['tasks']:
+                lines.append([('Tasks: ', GRAY), (', '.join(day['tasks']), BLACK)])
+            if not day['events']:
+                lines.append([('None', GRAY)])
+            for event in day['events']:
+                if event['time']:
+                    lines.append([(event['time'], GRAY), (' ' + event['summary'], BLACK)])
+                else:
+                    lines.append([(event['summary'], BLACK)])
+            for parts in lines:
+                if y + lineHeight > bottom:
+                    return
+                draw_line(y, parts)
+                y += lineHeight
+            y += self.y(20)
+
+        if y + self.y(63) + lineHeight > bottom:
+            return
+        y += self.y(20)
+        draw.text((left, y), 'Memo', font=headingFont, fill=BLACK)
+        y += self.y(43)
+        for line in (view['memo_text'] or '').split('\n'):
+            if y + lineHeight > bottom:
+                return
+            draw.text((left, y), self.fit_text(draw, line.strip(), memoFont, maxWidth), font=memoFont, fill=BLACK)
+            y += lineHeight
+
+    def draw_stale(self, draw, view):
+        # Small note in the bottom left corner for every source shown from its last good data
+        font = self.get_font('Lexend-Light.ttf', 14)
+        y = self.imageHeight - self.y(8)
+        for entry in reversed(view['stale']):
+            y -= self.y(18)
+            draw.text((self.x(10), y), '{0} as of {1}'.format(entry['name'], entry['time']), font=font, fill=GRAY)
+
+    def render(self, view, path_to_server_image):
+        image = self.background.copy()
+        draw = ImageDraw.Draw(image)
+        self.draw_weather(draw, view)
+        self.draw_events(draw, view)
+        self.draw_stale(draw, view)
+        image.save(path_to_server_image, 'PNG')
+        self.logger.info('Dashboard rendered and saved to file.')
+        return True
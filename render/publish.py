@@ -0,0 +1,67 @@
+"""
+This is how a rendered frame reaches the file nginx serves. Renderers write into a staging file next to the image, the
+staging file is checked to be a complete PNG, and only then is it renamed over the published image, so a device that
+wakes up in the middle of a render still downloads the previous frame in one piece. The last few published frames are
+kept next to it (<name>.1.png is the most recent one) so a good image stays around if something goes wrong.
+"""
+
+import logging
+import os
+import os.path
+import shutil
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Zero length IEND chunk with its CRC, always the last 12 bytes of a complete PNG
+PNG_IEND = b'\x00\x00\x00\x00IEND\xaeB`\x82'
+
+
+class FramePublisher:
+
+    def __init__(self, history=2):
+        self.logger = logging.getLogger('maginkdash')
+        self.history = history
+
+    def get_staging_path(self, path_to_server_image):
+        base, ext = os.path.splitext(path_to_server_image)
+        return base + '.staging' + ext
+
+    def get_history_path(self, path_to_server_image, index):
+        base, ext = os.path.splitext(path_to_server_image)
+        return '{0}.{1}{2}'.format(base, index, ext)
+
+    def validate(self, path):
+        # Cheap check for a truncated or non-PNG response, without decoding the image
+        if not os.path.exists(path) or os.path.getsize(path) < len(PNG_SIGNATURE) + len(PNG_IEND):
+            return False
+        with open(path, 'rb') as file:
+            head = file.read(len(PNG_SIGNATURE))
+            file.seek(-len(PNG_IEND), os.SEEK_END)
+            tail = file.read()
+        return head == PNG_SIGNATURE and tail == PNG_IEND
+
+    def rotate(self, path_to_server_image):
+        # Shift the kept frames by one and copy the published one into the first slot. The published image itself is
+        # not moved, so it never disappears from under nginx.
+        if self.history < 1 or not os.path.exists(path_to_server_image):
+            return
+        for index in range(self.history - 1, 0, -1):
+            older = self.get_history_path(path_to_server_image, index)
+            if os.path.exists(older):
+                os.replace(older, self.get_history_path(path_to_server_image, index + 1))
+        first = self.get_history_path(path_to_server_image, 1)
+        try:
+            os.link(path_to_server_image, first + '.tmp')
+        except OSError:
+            # Not every filesystem supports hard links
+            shutil.copy2(path_to_server_image, first + '.tmp')
+        os.replace(first + '.tmp', first)
+
+    def discard(self, staging_path):
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+
+    def publish(self, staging_path, path_to_server_image):
+        # The staging file is expected to be validated already
+        self.rotate(path_to_server_image)
+        os.replace(staging_path, path_to_server_image)
+        self.logger.info('Frame published to ' + path_to_server_image)
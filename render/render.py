@@ -5,37 +5,96 @@ instance, sized to the resolution of the eInk display and takes a screenshot.
 This might sound like a convoluted way to generate the calendar, but I'm doing so mainly because (i) it's easier to
 format the calendar exactly the way I want it using HTML/CSS, and (ii) I can delink the generation of the
 calendar and refreshing of the eInk display.
+
+With the 'native' renderer the same layout is drawn directly into an image instead (see native.py), for setups that
+can't afford to run a browser.
 """
 
 from time import sleep
 from datetime import timedelta
+import hashlib
+import os.path
 import pathlib
 import string
 import logging
-import shutil
 import requests
 import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from render.template import DashboardTemplate
+from render.assets import AssetBuilder
+from render.publish import FramePublisher
+from metrics.metrics import Metrics
+
+
+class RenderError(Exception):
+    pass
 
 
 class RenderHelper:
 
-    def __init__(self, width, height, nginx_server_dir, nginx_serving_path, browserless_url, browserless_token):
+    def __init__(self, width, height, nginx_server_dir=None, nginx_serving_path=None, browserless_url=None, browserless_token=None,
+                 renderer='browserless', eink=None, framePatch=None, template='dashboard_template.html', htmlName='dashboard.html',
+                 browserless_mode='screenshot', browserless_ws=None, frameHistory=2):
         self.logger = logging.getLogger('maginkdash')
         self.currPath = str(pathlib.Path(__file__).parent.absolute())
         self.imageWidth = width
         self.imageHeight = height
         self.nginx_server_dir = nginx_server_dir
         self.nginx_serving_path = nginx_serving_path
-        self.htmlFile = self.nginx_server_dir + 'dashboard.html'
         self.browserless_url = browserless_url
         self.browserless_token = browserless_token
-        
-        self._init_css_and_font()
+        # Number of updates where nothing on the dashboard changed and the screenshot was skipped
+        self.skippedRenders = 0
+        self.metrics = Metrics.get_instance()
+        self.renderer = renderer
+        self.template = DashboardTemplate(os.path.join(self.currPath, template))
+        self.htmlName = htmlName
+
+        # Frames are rendered into a staging file and only renamed over the served image once complete
+        self.framePublisher = FramePublisher(history=frameHistory)
+
+        if self.renderer == 'native':
+            # Imported here so that Pillow is only needed when the native renderer is used
+            from render.native import NativeRenderer
+            self.nativeRenderer = NativeRenderer(width, height)
+        else:
+            self.htmlFile = self.nginx_server_dir + htmlName
+            # Kept-alive connection to browserless, retried with a backoff when it is busy or restarting
+            self.session = requests.Session()
+            retries = Retry(total=3, backoff_factor=2, status_forcelist=[429, 500, 502, 503, 504],
+                            allowed_methods=['POST'])
+            self.session.mount('http://', HTTPAdapter(max_retries=retries, pool_maxsize=2))
+            self.session.mount('https://', HTTPAdapter(max_retries=retries, pool_maxsize=2))
+
+        # In 'session' mode a page stays loaded in browserless and new dashboards are pushed into it
+        self.browserSession = None
+        if self.renderer != 'native' and browserless_mode == 'session':
+            from render.browsersession import BrowserSession
+            ws_endpoint = browserless_ws or BrowserSession.get_ws_endpoint(browserless_url, browserless_token)
+            self.browserSession = BrowserSession(ws_endpoint, self.nginx_serving_path + htmlName, width, height)
+
+        # Optional reduction of every published frame to the gray levels of the e-ink panel
+        self.einkConverter = None
+        if eink is not None:
+            from render.eink import EinkConverter
+            self.einkConverter = EinkConverter(levels=eink.get('levels', 8), dither=eink.get('dither', 'bayer'),
+                                               bpp=eink.get('bpp', 4))
+        # Optional dirty rectangle patch against the previously published frame
+        self.frameDiff = None
+        if framePatch is not None:
+            from render.framediff import FrameDiff
+            self.frameDiff = FrameDiff(tile=framePatch.get('tile', 8))
+        self.assetsVersion = self._get_assets_version()
     
-    def _init_css_and_font(self):
-        shutil.copytree(src=self.currPath + "/css", dst=self.nginx_server_dir + "/css", dirs_exist_ok=True)
-        shutil.copytree(src=self.currPath + "/font", dst=self.nginx_server_dir + "/font", dirs_exist_ok=True)
-        shutil.copy2(src=self.currPath + "/background.jpg", dst=self.nginx_server_dir)
+    def _get_assets_version(self):
+        # Stylesheets, fonts and background change what the screenshot looks like just as much as the data does
+        digest = hashlib.sha256()
+        for path in sorted(pathlib.Path(self.currPath).glob('css/*')) + sorted(pathlib.Path(self.currPath).glob('font/*')) + \
+                [pathlib.Path(self.currPath + '/background.jpg')]:
+            digest.update(path.name.encode('utf-8'))
+            digest.update(path.read_bytes())
+        return digest.hexdigest()
 
     def get_screenshot(self, path_to_server_image):
         url = self.browserless_url + "/screenshot"
@@ -43,7 +102,7 @@ class RenderHelper:
         headers = {'Cache-Control': 'no-cache', 'Content-type': 'application/json',
                    'Accept': 'image/png'}
         data = {
-            'url': self.nginx_serving_path + "dashboard.html",
+            'url': self.nginx_serving_path + self.htmlName,
             'options': {
                 'type': 'png'
             },
@@ -53,15 +112,25 @@ class RenderHelper:
             },
             'waitForTimeout': 30
         }
-        r = requests.post(url, data=json.dumps(data), headers=headers, params=params, stream=True)
-        
-        if r.status_code == 200:
-            with open(path_to_server_image, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=1024): 
-                    if chunk: # filter out keep-alive new chunks
+        try:
+            with self.metrics.timer('screenshot'), \
+                    self.session.post(url, data=json.dumps(data), headers=headers, params=params, stream=True,
+                                      timeout=(10, 90)) as r:
+                if r.status_code != 200:
+                    self.logger.error('Screenshot failed with status {0}: {1}'.format(r.status_code, r.text[:200]))
+                    self.metrics.inc('errors', source='screenshot')
+                    return False
+                with open(path_to_server_image, 'wb') as f:
+                    for chunk in r.iter_content(chunk_size=65536):
                         f.write(chunk)
+        except requests.exceptions.RequestException as e:
+            self.logger.error('Screenshot request failed: {0}'.format(e))
+            self.metrics.inc('errors', source='screenshot')
+            return False
+        self.metrics.inc('screenshot_bytes', os.path.getsize(path_to_server_image))
 
         self.logger.info('Screenshot captured and saved to file.')
+        return True
 
     def get_short_time(self, datetimeObj, is24hour=False):
         datetime_str = ''
@@ -81,73 +150,157 @@ class RenderHelper:
                 datetime_str = '{}{}am'.format(str(datetimeObj.hour), datetime_str)
         return datetime_str
 
-    def process_inputs(self, current_date, current_weather, hourly_forecast, daily_forecast, event_list, task_list, num_cal_days, todos_text, path_to_server_image):
-
-        # Read html template
-        with open(self.currPath + '/dashboard_template.html', 'r') as file:
-            dashboard_template = file.read()
-
-        # Populate the date and events
-        cal_events_list = []
+    def build_view(self, current_date, current_weather, hourly_forecast, daily_forecast, event_list, task_list, num_cal_days, todos_text, stale=None):
+        # Reduce the inputs to exactly what ends up on the dashboard, so that irrelevant changes in the raw data
+        # (e.g. forecast timestamps or event update times) don't count as a change
+        days = []
         for i in range(num_cal_days):
-            cal_events_text = ""
-            
-            if len(task_list[i]) > 0:
-                cal_events_text += '<div class="event"><span class="event-time">Tasks: </span>'
-                for task in task_list[i]:
-                    cal_events_text += task['title'] + ', '
-                cal_events_text = cal_events_text[:-2]
-                cal_events_text += '</div>\n'
-                    
-            if len(event_list[i]) > 0:
-                cal_events_text += ""
-            else:
-                cal_events_text += '<div class="event"><span class="event-time">None</span></div>'
+            day = {
+                'name': (current_date + timedelta(days=i)).strftime("%A"),
+                'tasks': [task['title'] for task in task_list[i]],
+                'events': []
+            }
             for event in event_list[i]:
-                cal_events_text += '<div class="event">'
                 if event["isMultiday"] or event["allday"]:
-                    cal_events_text += event['summary']
+                    day['events'].append({'time': '', 'summary': event['summary']})
                 else:
-                    cal_events_text += '<span class="event-time">' + self.get_short_time(event['startDatetime']) + '</span> ' + event['summary']
-                cal_events_text += '</div>\n'
-            cal_events_list.append(cal_events_text)
-
-        # Append the bottom and write the file
-        htmlFile = open(self.nginx_server_dir + '/dashboard.html', "w")
-        htmlFile.write(dashboard_template.format(
-            day=current_date.strftime("%-d"),
-            month=current_date.strftime("%B"),
-            weekday=current_date.strftime("%A"),
-            tomorrow=(current_date + timedelta(days=1)).strftime("%A"),
-            dayafter=(current_date + timedelta(days=2)).strftime("%A"),
-            # dayafter2=(current_date + timedelta(days=3)).strftime("%A"),
-            # dayafter3=(current_date + timedelta(days=4)).strftime("%A"),
-            events_today=cal_events_list[0],
-            events_tomorrow=cal_events_list[1],
-            events_dayafter=cal_events_list[2],
-            # events_dayafter2=cal_events_list[3],
-            # events_dayafter3=cal_events_list[4],
+                    day['events'].append({'time': self.get_short_time(event['startDatetime']), 'summary': event['summary']})
+            if i < len(daily_forecast):
+                day['weather'] = {
+                    'id': daily_forecast[i]["weather"][0]["id"],
+                    'pop': str(round(daily_forecast[i]["pop"] * 100)),
+                    'min': str(round(daily_forecast[i]["temp"]["min"])),
+                    'max': str(round(daily_forecast[i]["temp"]["max"]))
+                }
+            days.append(day)
+
+        return {
+            'day': current_date.strftime("%-d"),
+            'month': current_date.strftime("%B"),
+            'weekday': current_date.strftime("%A"),
             # I'm choosing to show the forecast for the next hour instead of the current weather
-            # current_weather_text=string.capwords(current_weather["weather"][0]["description"]),
-            # current_weather_id=current_weather["weather"][0]["id"],
-            # current_weather_temp=round(current_weather["temp"]),
-            current_weather_text=string.capwords(hourly_forecast[1]["weather"][0]["description"]),
-            current_weather_id=hourly_forecast[1]["weather"][0]["id"],
-            current_weather_temp=round(hourly_forecast[1]["temp"]),
-            today_weather_id=daily_forecast[0]["weather"][0]["id"],
-            tomorrow_weather_id=daily_forecast[1]["weather"][0]["id"],
-            dayafter_weather_id=daily_forecast[2]["weather"][0]["id"],
-            today_weather_pop=str(round(daily_forecast[0]["pop"] * 100)),
-            tomorrow_weather_pop=str(round(daily_forecast[1]["pop"] * 100)),
-            dayafter_weather_pop=str(round(daily_forecast[2]["pop"] * 100)),
-            today_weather_min=str(round(daily_forecast[0]["temp"]["min"])),
-            tomorrow_weather_min=str(round(daily_forecast[1]["temp"]["min"])),
-            dayafter_weather_min=str(round(daily_forecast[2]["temp"]["min"])),
-            today_weather_max=str(round(daily_forecast[0]["temp"]["max"])),
-            tomorrow_weather_max=str(round(daily_forecast[1]["temp"]["max"])),
-            dayafter_weather_max=str(round(daily_forecast[2]["temp"]["max"])),
-            memo_text=todos_text
-        ))
-        htmlFile.close()
-
-        self.get_screenshot(path_to_server_image)
+            # 'current_weather_text': string.capwords(current_weather["weather"][0]["description"]),
+            # 'current_weather_id': current_weather["weather"][0]["id"],
+            # 'current_weather_temp': round(current_weather["temp"]),
+            'current_weather_text': string.capwords(hourly_forecast[1]["weather"][0]["description"]),
+            'current_weather_id': hourly_forecast[1]["weather"][0]["id"],
+            'current_weather_temp': round(hourly_forecast[1]["temp"]),
+            'days': days,
+            'memo_text': todos_text or '',
+            # Sources shown from their last good data, with the time it was fetched (the weekday too if not today)
+            'stale': [{'name': name.capitalize(),
+                       'time': ('' if fetched.date() == current_date else fetched.strftime("%a ")) + self.get_short_time(fetched)}
+                      for name, fetched in stale or []]
+        }
+
+    def get_view_digest(self, view, dashboard_template):
+        digest = hashlib.sha256()
+        digest.update(json.dumps(view, sort_keys=True).encode('utf-8'))
+        digest.update(dashboard_template.encode('utf-8'))
+        digest.update(self.assetsVersion.encode('utf-8'))
+        # The same view gives a different frame at another size, with the other renderer or another patch tile
+        digest.update('{0}x{1}:{2}'.format(self.imageWidth, self.imageHeight, self.renderer).encode('utf-8'))
+        if self.frameDiff is not None:
+            digest.update('patch:{0}'.format(self.frameDiff.tile).encode('utf-8'))
+        if self.einkConverter is not None:
+            digest.update('{0}:{1}:{2}'.format(self.einkConverter.levels, self.einkConverter.dither,
+                                               self.einkConverter.bpp).encode('utf-8'))
+        return digest.hexdigest()
+
+    def process_inputs(self, current_date, current_weather, hourly_forecast, daily_forecast, event_list, task_list, num_cal_days, todos_text, path_to_server_image, stale=None):
+        # stale is a list of (source name, datetime of its last good data) for the sources that failed. Returns True
+        # when a new frame was published and False when the published one already shows the same, and raises
+        # RenderError when no frame could be rendered
+
+        # Compiled html template, only read again from disk after it changed
+        template = self.template.load()
+
+        view = self.build_view(current_date, current_weather, hourly_forecast, daily_forecast, event_list, task_list, num_cal_days, todos_text, stale)
+
+        # Skip the page and the screenshot altogether when the last published frame already shows the same thing
+        digest = self.get_view_digest(view, template.source)
+        digestFile = path_to_server_image + '.digest'
+        if os.path.exists(path_to_server_image) and os.path.exists(digestFile):
+            with open(digestFile, 'r') as file:
+                if file.read() == digest:
+                    self.skippedRenders += 1
+                    self.metrics.inc('skipped_renders')
+                    self.logger.info('Dashboard inputs unchanged, render skipped ({0} skipped so far)'.format(self.skippedRenders))
+                    return False
+
+        stagingPath = self.framePublisher.get_staging_path(path_to_server_image)
+        if self.renderer == 'native':
+            with self.metrics.timer('render_native'):
+                rendered = self.nativeRenderer.render(view, stagingPath)
+        else:
+            with self.metrics.timer('render_html'):
+                html = self.write_html(template, view)
+            rendered = False
+            if self.browserSession is not None:
+                with self.metrics.timer('browser_session'):
+                    rendered = self.browserSession.render(html, template.mtime, stagingPath)
+                if not rendered:
+                    self.metrics.inc('errors', source='browser_session')
+            if not rendered:
+                # The one-off screenshot still works when the session can't be used
+                rendered = self.get_screenshot(stagingPath)
+
+        if not rendered or not self.framePublisher.validate(stagingPath):
+            self.metrics.inc('errors', source='render')
+            self.framePublisher.discard(stagingPath)
+            raise RenderError('No complete frame was rendered, keeping the published one')
+
+        frame = None
+        if self.einkConverter is not None:
+            with self.metrics.timer('eink'):
+                frame = self.einkConverter.process(stagingPath, path_to_server_image)
+        elif self.frameDiff is not None:
+            frame = self.get_gray_frame(stagingPath)
+        with self.metrics.timer('publish'):
+            self.framePublisher.publish(stagingPath, path_to_server_image)
+            if self.frameDiff is not None:
+                self.frameDiff.update(path_to_server_image, frame)
+            with open(digestFile, 'w') as file:
+                file.write(digest)
+        self.metrics.inc('renders')
+        return True
+
+    def get_published_files(self, path_to_server_image):
+        # Every file a device may download for this dashboard
+        files = [path_to_server_image]
+        if self.einkConverter is not None:
+            files.append(self.einkConverter.get_raw_path(path_to_server_image))
+        if self.frameDiff is not None:
+            files.append(self.frameDiff.get_paths(path_to_server_image)[1])
+        return files
+
+    def get_frame_digest(self, path_to_server_image):
+        # Digest of the published frame that patches are based on, None without frame patches
+        if self.frameDiff is None:
+            return None
+        return self.frameDiff.read_frame_digest(path_to_server_image)
+
+    def get_gray_frame(self, path_to_server_image):
+        import numpy as np
+        from PIL import Image
+        with Image.open(path_to_server_image) as image:
+            return np.asarray(image.convert('L'))
+
+    def write_html(self, template, view):
+        # Add what is only needed for the HTML layout on top of the view
+        forecastDays = sum(1 for day in view['days'] if 'weather' in day)
+        shrink = min(1, 3 / forecastDays) if forecastDays else 1
+        days = []
+        for i, day in enumerate(view['days']):
+            days.append(dict(day, title='Today' if i == 0 else day['name'], tasks_text=', '.join(day['tasks'])))
+        context = dict(view,
+                       days=days,
+                       background=AssetBuilder.get_background_name(self.imageWidth, self.imageHeight),
+                       forecast_width='{0:.4f}'.format(100 / forecastDays) if forecastDays else '100',
+                       forecast_icon_size='{0:g}'.format(round(10 * shrink, 2)),
+                       forecast_text_size='{0:g}'.format(round(2.4 * shrink, 2)))
+
+        html = template.render(context)
+        with open(self.nginx_server_dir + '/' + self.htmlName, "w") as htmlFile:
+            htmlFile.write(html)
+        return html
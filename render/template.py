@@ -0,0 +1,110 @@
+"""
+This is the template engine behind dashboard.html. The template is compiled once into a tree of text, field and section
+nodes and only recompiled when the file's modification time changes. Rendering walks that tree once, appending to a
+single list that is joined at the end.
+
+Syntax:
+    {name}              value of name, HTML escaped
+    {#name}...{/name}   repeated for every item if name is a list, rendered once if it is any other truthy value
+    {^name}...{/name}   rendered once if name is missing, empty or falsy
+Names are looked up in the current section item first, then in the enclosing ones. Braces that don't match these
+forms are left as they are.
+"""
+
+import html
+import os
+import re
+import threading
+
+TAG_RE = re.compile(r'\{([#^/]?)([A-Za-z_][A-Za-z0-9_]*)\}')
+MISSING = object()
+
+
+class TemplateError(Exception):
+    pass
+
+
+class DashboardTemplate:
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.source = None
+        self.nodes = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        # Recompile only when the file on disk changed since the last load
+        mtime = os.stat(self.path).st_mtime_ns
+        with self.lock:
+            if mtime != self.mtime:
+                with open(self.path, 'r') as file:
+                    source = file.read()
+                self.nodes = self.compile(source)
+                self.source = source
+                self.mtime = mtime
+            return self
+
+    def compile(self, source):
+        # Nodes are ('text', str), ('field', name) and ('section', name, inverted, children)
+        root = []
+        stack = [(None, root)]
+        pos = 0
+        for match in TAG_RE.finditer(source):
+            if match.start() > pos:
+                stack[-1][1].append(('text', source[pos:match.start()]))
+            pos = match.end()
+            kind, name = match.groups()
+            if kind == '':
+                stack[-1][1].append(('field', name))
+            elif kind in '#^':
+                children = []
+                stack[-1][1].append(('section', name, kind == '^', children))
+                stack.append((name, children))
+            else:
+                if stack[-1][0] != name:
+                    raise TemplateError('Unexpected {{/{0}}} in {1}'.format(name, self.path))
+                stack.pop()
+        if len(stack) > 1:
+            raise TemplateError('Unclosed {{#{0}}} in {1}'.format(stack[-1][0], self.path))
+        if pos < len(source):
+            root.append(('text', source[pos:]))
+        return root
+
+    def lookup(self, contexts, name):
+        for context in reversed(contexts):
+            if isinstance(context, dict) and name in context:
+                return context[name]
+        return MISSING
+
+    def render_nodes(self, nodes, contexts, out):
+        for node in nodes:
+            if node[0] == 'text':
+                out.append(node[1])
+            elif node[0] == 'field':
+                value = self.lookup(contexts, node[1])
+                if value is not MISSING and value is not None:
+                    out.append(html.escape(str(value), quote=False))
+            else:
+                _, name, inverted, children = node
+                value = self.lookup(contexts, name)
+                empty = value is MISSING or not value
+                if inverted:
+                    if empty:
+                        self.render_nodes(children, contexts, out)
+                elif empty:
+                    continue
+                elif isinstance(value, (list, tuple)):
+                    for item in value:
+                        contexts.append(item)
+                        self.render_nodes(children, contexts, out)
+                        contexts.pop()
+                else:
+                    contexts.append(value)
+                    self.render_nodes(children, contexts, out)
+                    contexts.pop()
+
+    def render(self, context):
+        out = []
+        self.render_nodes(self.nodes, [context], out)
+        return ''.join(out)
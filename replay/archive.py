@@ -0,0 +1,106 @@
+"""
+This is the archive a recorded run is kept in. It holds every HTTP response the sources got in that run (the
+OpenWeatherMap forecast, the Calendar and Tasks list pages, the memo or the todo list) and the view every dashboard
+profile was rendered from, all as plain JSON. A replay answers the requests of the sources from the archive instead of
+the network (see transport.py), so fetching, normalization, bucketing and parsing all run again on the recorded data,
+and the views it ends up with are compared with the recorded ones. Nothing in the archive depends on the classes of
+the code that recorded it, so it can be replayed on any later or earlier commit.
+
+Responses are matched by method, URL and body, and answered in the order they were recorded. The key is a hash, so
+the API keys in the URLs are not kept in clear, and only the URL without its query string is stored for reference.
+"""
+
+import collections
+import gzip
+import hashlib
+import json
+import logging
+import os
+import os.path
+import threading
+
+VERSION = 2
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class RunArchive:
+
+    def __init__(self, recorded=None, displayTZ=None, exchanges=None, views=None, failed=None):
+        self.logger = logging.getLogger('maginkdash')
+        # ISO time of the recorded run in the display timezone, a replay runs at that time
+        self.recorded = recorded
+        self.displayTZ = displayTZ
+        # Every response in the order it came in
+        self.exchanges = exchanges or []
+        # profile name: view the profile was rendered from
+        self.views = views or {}
+        # Sources that failed in the recorded run, a replay can't show their last good data
+        self.failed = failed or []
+        self.lock = threading.Lock()
+        self.pending = None
+
+    @staticmethod
+    def get_key(method, url, body):
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', 'replace')
+        raw = json.dumps([method.upper(), url, body or ''])
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def add(self, method, url, body, status, contentType, content):
+        # Called from the fetch threads for every response of a recording
+        exchange = {'key': self.get_key(method, url, body), 'method': method.upper(), 'url': url.split('?', 1)[0],
+                    'status': status, 'contentType': contentType}
+        text = content.decode('utf-8', 'replace') if isinstance(content, bytes) else content
+        try:
+            exchange['json'] = json.loads(text)
+        except ValueError:
+            exchange['text'] = text
+        with self.lock:
+            self.exchanges.append(exchange)
+
+    def take(self, method, url, body):
+        # Returns (status, content type, content bytes) of the next recorded response to the request, or None. The last
+        # one is kept for any further identical request.
+        with self.lock:
+            if self.pending is None:
+                self.pending = collections.defaultdict(collections.deque)
+                for exchange in self.exchanges:
+                    self.pending[exchange['key']].append(exchange)
+            responses = self.pending.get(self.get_key(method, url, body))
+            if not responses:
+                return None
+            exchange = responses.popleft() if len(responses) > 1 else responses[0]
+        content = json.dumps(exchange['json']) if 'json' in exchange else exchange['text']
+        return exchange['status'], exchange['contentType'], content.encode('utf-8')
+
+    def save(self, archiveFile):
+        directory = os.path.dirname(archiveFile)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        state = {'version': VERSION, 'recorded': self.recorded, 'displayTZ': self.displayTZ, 'failed': self.failed,
+                 'views': self.views, 'exchanges': self.exchanges}
+        tmpFile = archiveFile + '.tmp'
+        with gzip.open(tmpFile, 'wt', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(tmpFile, archiveFile)
+        self.logger.info('Recorded run saved to {0} ({1} responses, {2} bytes)'.format(
+            archiveFile, len(self.exchanges), os.path.getsize(archiveFile)))
+
+    @classmethod
+    def load(cls, archiveFile):
+        try:
+            with gzip.open(archiveFile, 'rt', encoding='utf-8') as file:
+                state = json.load(file)
+        except (OSError, EOFError, ValueError) as e:
+            raise ArchiveError('{0} is not a readable run archive: {1}'.format(archiveFile, e))
+        if not isinstance(state, dict) or state.get('version') != VERSION:
+            raise ArchiveError('{0} was recorded with an unsupported archive version'.format(archiveFile))
+        return cls(recorded=state['recorded'], displayTZ=state['displayTZ'], exchanges=state['exchanges'],
+                   views=state['views'], failed=state['failed'])
+
+    def get_changed_views(self, views):
+        # Names of the profiles whose view differs from the recorded one, e.g. after a change to the data handling
+        return sorted(name for name, recorded in self.views.items() if views.get(name) != recorded)
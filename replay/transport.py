@@ -0,0 +1,81 @@
+"""
+These take the place of the network for a recorded or replayed run. The plain HTTP sources go through a requests
+adapter mounted on the session of the HTTP cache, and the Google client through a wrapper around its httplib2
+connection. While recording they pass every request on and add the response to the archive, while replaying they
+answer from the archive and fail like an unreachable server for a request that was never recorded.
+"""
+
+import io
+import httplib2
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+
+class RecordingAdapter(HTTPAdapter):
+
+    def __init__(self, archive, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        # Reads the whole body, it stays available to the caller and to iter_content
+        self.archive.add(request.method, request.url, request.body, response.status_code,
+                         response.headers.get('Content-Type'), response.content)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+
+    def __init__(self, archive):
+        super().__init__()
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        recorded = self.archive.take(request.method, request.url, request.body)
+        if recorded is None:
+            raise requests.exceptions.ConnectionError(
+                'No recorded response for {0} {1}'.format(request.method, request.url.split('?', 1)[0]), request=request)
+        status, contentType, content = recorded
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict({'Content-Type': contentType or 'application/json'})
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(content)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+class RecordingHttp:
+
+    def __init__(self, http, archive):
+        self.http = http
+        self.archive = archive
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        response, content = self.http.request(uri, method, body=body, headers=headers, **kwargs)
+        self.archive.add(method, uri, body, response.status, response.get('content-type'), content)
+        return response, content
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+
+class ReplayHttp:
+
+    def __init__(self, archive):
+        self.archive = archive
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        recorded = self.archive.take(method, uri, body)
+        if recorded is None:
+            raise ConnectionError('No recorded response for {0} {1}'.format(method, uri.split('?', 1)[0]))
+        status, contentType, content = recorded
+        return httplib2.Response({'status': status, 'content-type': contentType or 'application/json'}), content
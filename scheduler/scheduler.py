@@ -0,0 +1,184 @@
+"""
+This decides when each data source is fetched again. Every source has its own cadence, so the weather can be refreshed
+every half hour while the memo is checked every few minutes. During quiet hours (e.g. overnight) sources are fetched
+at a slower cadence, or not at all until the quiet hours end, and the calendar is checked more often while an event
+is about to start. When the date changes everything is due at once, since the dashboard starts from the new day.
+
+Results are compared with the previous ones per source, so the dashboard is only rendered again when one of them
+actually returned something new. A result only counts as shown once every dashboard was rendered with it, so a render
+that failed is tried again on the next run. The schedule and the digests are kept in a small state file, so a run
+started by cron or a systemd timer (main.py --once) carries on where the previous one stopped.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import os.path
+import pathlib
+from datetime import datetime as dt
+
+# Seconds between fetches, the same hourly refresh of everything as before by default
+DEFAULT_CADENCES = {'weather': 3600, 'calendar': 3600, 'tasks': 3600, 'memo': 3600}
+
+
+class RefreshScheduler:
+
+    def __init__(self, tz, cadences=None, quietHours=None, eventLead=None, retry=300, stateFile=None):
+        self.logger = logging.getLogger('maginkdash')
+        self.currPath = str(pathlib.Path(__file__).parent.absolute())
+        self.stateFile = stateFile if stateFile is not None else self.currPath + '/state/state.json'
+        self.tz = tz
+        self.cadences = dict(DEFAULT_CADENCES)
+        self.cadences.update(cadences or {})
+        # {"start": "23:00", "end": "06:00", "cadence": 10800}, without a cadence nothing is fetched in quiet hours
+        self.quietHours = None
+        if quietHours is not None:
+            self.quietHours = (self.parse_time(quietHours['start']), self.parse_time(quietHours['end']),
+                               quietHours.get('cadence'))
+        # {"minutes": 30, "cadence": 300}, calendar cadence while the next event starts within that many minutes
+        self.eventLead = eventLead
+        # Seconds until a source that failed is tried again, unless its cadence is shorter
+        self.retry = retry
+        self.nextDue = {}
+        self.digests = {}
+        # Digests of results that were not shown yet, they only replace the others once the dashboard was rendered
+        self.pendingDigests = {}
+        self.upcoming = []
+        self.boundaries = []
+        self.currDate = None
+
+    @staticmethod
+    def parse_time(value):
+        return dt.strptime(value, '%H:%M').time()
+
+    def localize(self, date, time):
+        return self.tz.localize(dt.combine(date, time))
+
+    def in_quiet_hours(self, when):
+        if self.quietHours is None:
+            return False
+        start, end, _ = self.quietHours
+        current = when.time()
+        if start <= end:
+            return start <= current < end
+        return current >= start or current < end
+
+    def get_quiet_end(self, when):
+        # First end of the quiet hours after when
+        end = self.localize(when.date(), self.quietHours[1])
+        return end if end > when else self.localize(when.date() + datetime.timedelta(days=1), self.quietHours[1])
+
+    def get_next_midnight(self, now):
+        return self.localize(now.date() + datetime.timedelta(days=1), datetime.time.min)
+
+    def set_upcoming(self, starts, ends=()):
+        # Start times of the timed events on the dashboard, to refresh the calendar more often ahead of them, and
+        # their start and end times, where the frame is expected to change
+        self.upcoming = sorted(starts)
+        self.boundaries = sorted(list(starts) + list(ends))
+
+    def get_next_event_lead(self, now):
+        # Returns the start of the lead window of the next event, now if already inside one, or None
+        if self.eventLead is None:
+            return None
+        lead = datetime.timedelta(minutes=self.eventLead['minutes'])
+        for start in self.upcoming:
+            if start > now:
+                return max(start - lead, now)
+        return None
+
+    def get_cadence(self, name, now):
+        cadence = self.cadences[name]
+        if name == 'calendar':
+            leadStart = self.get_next_event_lead(now)
+            if leadStart is not None and leadStart <= now:
+                cadence = min(cadence, self.eventLead['cadence'])
+        if self.in_quiet_hours(now) and self.quietHours[2] is not None:
+            cadence = max(cadence, self.quietHours[2])
+        return cadence
+
+    def get_due(self, now):
+        # Names of the sources that should be fetched now, all of them on the first run and after a date change
+        if now.date() != self.currDate:
+            self.currDate = now.date()
+            return list(self.cadences)
+        return [name for name in self.cadences if name not in self.nextDue or self.nextDue[name] <= now]
+
+    def mark(self, name, now, success=True):
+        cadence = self.get_cadence(name, now)
+        nextDue = now + datetime.timedelta(seconds=cadence if success else min(cadence, self.retry))
+        if name == 'calendar':
+            # Don't sleep through the start of the lead window of the next event
+            leadStart = self.get_next_event_lead(now)
+            if leadStart is not None and now < leadStart < nextDue:
+                nextDue = leadStart
+        if self.in_quiet_hours(nextDue) and self.quietHours[2] is None:
+            nextDue = self.get_quiet_end(nextDue)
+        self.nextDue[name] = nextDue
+
+    def has_changed(self, name, result):
+        # Compares a fetched result with the last one that was shown of the same source
+        digest = hashlib.sha256(repr(result).encode('utf-8')).hexdigest()
+        changed = self.digests.get(name) != digest
+        if changed:
+            self.pendingDigests[name] = digest
+        else:
+            self.pendingDigests.pop(name, None)
+        return changed
+
+    def commit_digests(self):
+        # Called once the results compared so far are on the dashboard
+        self.digests.update(self.pendingDigests)
+        self.pendingDigests = {}
+
+    def get_next_wakeup(self, now):
+        # The earliest moment a source is due, or the date changes
+        return min(list(self.nextDue.values()) + [self.get_next_midnight(now)])
+
+    def get_next_change(self, now, sources=('weather',)):
+        # The earliest moment the frame is expected to look different: the next start or end of a timed event, the
+        # date change, or the next fetch of the sources whose result changes with (almost) every fetch. The other
+        # sources are polled for edits nobody can foresee, so their cadences say nothing about when the frame changes.
+        changes = [self.get_next_midnight(now)]
+        changes += [boundary for boundary in self.boundaries if boundary > now][:1]
+        changes += [self.nextDue[name] for name in sources if name in self.nextDue]
+        return min(changes)
+
+    def get_idle_seconds(self, now):
+        return max((self.get_next_wakeup(now) - now).total_seconds(), 0)
+
+    def load_state(self):
+        # Restores the schedule of an earlier run, returns what the caller stored with it in save_state
+        if not os.path.exists(self.stateFile):
+            return {}
+        try:
+            with open(self.stateFile, 'r') as file:
+                state = json.load(file)
+        except ValueError:
+            self.logger.info('Scheduler state file is corrupt, starting from scratch')
+            return {}
+        self.nextDue = {name: dt.fromisoformat(nextDue) for name, nextDue in state['nextDue'].items()
+                        if name in self.cadences}
+        self.digests = state['digests']
+        self.pendingDigests = state.get('pendingDigests', {})
+        self.upcoming = [dt.fromisoformat(start) for start in state['upcoming']]
+        self.boundaries = [dt.fromisoformat(boundary) for boundary in state.get('boundaries', [])]
+        self.currDate = datetime.date.fromisoformat(state['currDate']) if state['currDate'] else None
+        return state.get('extra', {})
+
+    def save_state(self, **extra):
+        state = {
+            'nextDue': {name: nextDue.isoformat() for name, nextDue in self.nextDue.items()},
+            'digests': self.digests,
+            'pendingDigests': self.pendingDigests,
+            'upcoming': [start.isoformat() for start in self.upcoming],
+            'boundaries': [boundary.isoformat() for boundary in self.boundaries],
+            'currDate': self.currDate.isoformat() if self.currDate else None,
+            'extra': extra
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.stateFile)), exist_ok=True)
+        with open(self.stateFile + '.tmp', 'w') as file:
+            json.dump(state, file)
+        os.replace(self.stateFile + '.tmp', self.stateFile)
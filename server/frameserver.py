@@ -0,0 +1,121 @@
+"""
+This is an optional HTTP endpoint for the display itself, next to (or instead of) nginx. Every published frame file is
+held in memory with a strong ETag, so a device that sends If-None-Match for the frame it already shows gets a bodyless
+304 instead of the whole image. Every response also carries X-Next-Refresh, the number of seconds until the frame
+is next expected to change (an event starting or ending, the weather update or the date change), which the device can
+use as its sleep time. With frame patches every file of a dashboard also carries X-Frame-Digest, the digest of the
+frame it shows, which a patch has to be based on (see render/framediff.py). The metrics of the service are served on
+/metrics.
+"""
+
+import hashlib
+import logging
+import os.path
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPES = {'.png': 'image/png', '.raw': 'application/octet-stream', '.patch': 'application/octet-stream'}
+
+
+class FrameRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        frameServer = self.server.frameServer
+        if self.path == '/metrics' and frameServer.metrics is not None:
+            data = frameServer.metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        frame = frameServer.get_frame(self.path.split('?', 1)[0])
+        if frame is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        data, etag, contentType, headers = frame
+        notModified = etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]
+        self.send_response(304 if notModified else 200)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Next-Refresh', str(frameServer.get_next_refresh()))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if notModified:
+            self.end_headers()
+            frameServer.count('notModified')
+            return
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        frameServer.count('sent')
+
+    def log_message(self, format, *args):
+        frameServer = self.server.frameServer
+        frameServer.logger.debug('Frame server: ' + format % args)
+
+
+class FrameServer:
+
+    def __init__(self, host='0.0.0.0', port=8090, nextRefresh=None, defaultRefresh=3600, minRefresh=300, metrics=None):
+        self.logger = logging.getLogger('maginkdash')
+        self.host = host
+        self.port = port
+        # Called without arguments, returns the seconds until the dashboard is expected to change or None if unknown
+        self.nextRefresh = nextRefresh
+        self.defaultRefresh = defaultRefresh
+        self.minRefresh = minRefresh
+        # Served as Prometheus text on /metrics when given
+        self.metrics = metrics
+        self.frames = {}
+        self.lock = threading.Lock()
+        self.stats = {'sent': 0, 'notModified': 0}
+        self.httpd = None
+
+    def publish_file(self, path, headers=None):
+        # Serve the file under its name, e.g. /var/www/html/maginkdash.png as /maginkdash.png, with the extra headers
+        if not os.path.exists(path):
+            return False
+        with open(path, 'rb') as file:
+            data = file.read()
+        etag = '"{0}"'.format(hashlib.sha256(data).hexdigest()[:32])
+        contentType = CONTENT_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+        with self.lock:
+            self.frames['/' + os.path.basename(path)] = (data, etag, contentType, headers or {})
+        return True
+
+    def count(self, result):
+        with self.lock:
+            self.stats[result] += 1
+        if self.metrics is not None:
+            self.metrics.inc('frame_requests', result=result)
+
+    def get_frame(self, urlPath):
+        with self.lock:
+            return self.frames.get(urlPath)
+
+    def get_next_refresh(self):
+        seconds = self.nextRefresh() if self.nextRefresh is not None else None
+        if seconds is None:
+            return self.defaultRefresh
+        return max(int(seconds), self.minRefresh)
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer((self.host, self.port), FrameRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.frameServer = self
+        thread = threading.Thread(target=self.httpd.serve_forever, name='frameserver', daemon=True)
+        thread.start()
+        self.logger.info('Frame server listening on {0}:{1}'.format(self.host, self.port))
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None